@@ -2,9 +2,14 @@
 # pour ne pas les télécharger à la main, on crée un programme pour les importer automatiquement 
 # en sélectionnant uniquement les variables d'intérêt
 
-import pandas as pd
+import os
 import numpy as np
-from fonctions import recup_url, filtre_data
+
+# importable comme module (src.import_data.api_donnees_climat) ou lancé depuis src/import_data
+try:
+    from .fonctions import recup_url, filtre_data, schema
+except ImportError:
+    from fonctions import recup_url, filtre_data, schema
 
 cols = ['NOM_USUEL', 
         "AAAAMM",
@@ -18,83 +23,81 @@ cols = ['NOM_USUEL',
 
 cols_indic = cols[2:len(cols)] 
 
+# types explicites : pandas n'a pas à les deviner à chaque morceau lu
+dtypes = {"NOM_USUEL": "category", "AAAAMM": "int32"} | {c: "float64" for c in cols_indic}
+
 # pour chaque département, on va procéder de la même façon
-# on crée donc une fonction qui prend le département comme argument
+# on crée donc des fonctions qui prennent le département comme argument
+
+# adresse des fichiers mensuels ; PROJET_URL_MENS permet de pointer vers un autre serveur
+# (par exemple le serveur local de serveur_local.py)
+URL_MENS = os.environ.get("PROJET_URL_MENS",
+                          "https://object.files.data.gouv.fr/meteofrance/data/synchro_ftp/BASE/MENS/")
 
-def agreg_dpt(DEP):
-    df_filtre = recup_url.url_to_df(url = "https://object.files.data.gouv.fr/meteofrance/data/synchro_ftp/BASE/MENS/MENSQ_" + DEP + "_previous-1950-2023.csv.gz",
+# la Corse a un seul fichier (20), dupliqué ensuite en 2A et 2B
+LISTE_DEP = [f'{i:02}' for i in range(1,96)]
+
+def url_dpt(DEP):
+    return(URL_MENS + "MENSQ_" + DEP + "_previous-1950-2023.csv.gz")
+
+# lecture du fichier d'un département : seules les colonnes et les années utiles sont gardées
+def lire_dpt(DEP, session=None):
+    return(recup_url.url_to_df(url = url_dpt(DEP),
                         cols_a_conserver=cols,
                         type_zip="gz",
-                        plusieurs_fichiers=False)
-# on crée une variable ne contenant que l'annee 
-    df_filtre['AAAA'] = df_filtre['AAAAMM'].astype(str).str[:4].astype(int)
-    df_filtre['MM']= df_filtre['AAAAMM'].astype(str).str[-2:].astype(int)
+                        plusieurs_fichiers=False,
+                        session=session,
+                        dtype=dtypes,
+                        chunksize=100_000,
+                        filtre_lignes=filtre_data.filtre_aaaamm))
+
+# moyennes départementales par année et mois, à partir des relevés des stations lus par lire_dpt
+# (colonnes : variables moyennées, cols_indic par défaut)
+def agrege_dpt(df_filtre, DEP, colonnes=None):
+    df_filtre = df_filtre.copy()
+# on crée une variable ne contenant que l'annee (calcul entier, sans passer par du texte)
+    df_filtre['AAAA'] = (df_filtre['AAAAMM'] // 100).astype(schema.TYPES['AAAA'])
+    df_filtre['MM']= (df_filtre['AAAAMM'] % 100).astype(schema.TYPES['MM'])
 # on sélectionne nos mois et années d'intérêt
     df_filtre = filtre_data.filtre_annee_mois(df_filtre)
 # on calcule la moyenne départementale pour toutes les variables
-    df_filtre = df_filtre.groupby(['AAAA','MM'])[cols_indic].mean()
+    df_filtre = df_filtre.groupby(['AAAA','MM'])[colonnes or cols_indic].mean()
     df_filtre['DEP'] = DEP
     return(df_filtre)
 
-# on prépare une boucle pour importer un à un les fichiers départements
-# et concaténer les outputs de la fonction agreg_dpt
-liste_dep = list(np.arange(2,96))
-df = agreg_dpt("01")
-for i in liste_dep:
-    num = f'{i:02}'
-    df = pd.concat([df, agreg_dpt(num)])
-
-# on remet année et mois (devenues index) en variables normales
-df = df.reset_index() 
+def agreg_dpt(DEP, session=None):
+    return(agrege_dpt(lire_dpt(DEP, session), DEP))
 
-df["DEP"] = df.DEP.astype(str)
-df["DEP"] = df["DEP"].str.zfill(2)
+# saison (été ou hiver) et période (avant ou après 2015), calculées pour un département
+def ajoute_saison_periode(df):
+    conditions1 = [
+        (df['MM'] <= 3) | (df['MM'] == 12),
+        (df['MM'] >= 6) & (df['MM'] <= 9)
+        ]
 
-# on crée deux departements différents pour la Corse (jusque là codée en 20) pour pouvoir cartographier ensuite
-new_rows = df.loc[df['DEP']=="20"].copy()
-new_rows1 = new_rows.copy()
-new_rows["DEP"] = "2A"
-new_rows1["DEP"] = "2B"
-df = df._append([new_rows,new_rows1])
-df = df.loc[df["DEP"] != "20"]
+    values1 = ['hiver', 'été']
 
-# saison (été ou hiver)
-conditions1 = [
-    (df['MM'] <= 3) | (df['MM'] == 12),
-    (df['MM'] >= 6) & (df['MM'] <= 9)
-    ]
+    df['saison'] = np.select(conditions1, values1, default='Other')
 
-values1 = ['hiver', 'été']
+    conditions2 = [
+        (df['AAAA'] <= 2015),
+        (df['AAAA'] > 2015)
+        ]
 
-df['saison'] = np.select(conditions1, values1, default='Other')
+    values2 = ['avant_2015', 'apres_2015']
 
-# période (avant ou après 2015)
-conditions2 = [
-    (df['AAAA'] <= 2015),
-    (df['AAAA'] > 2015)
-    ]
-
-values2 = ['avant_2015', 'apres_2015']
-
-df['periode'] = np.select(conditions2, values2, default='Other')
-
-base_temp = df
-base_temp.head()
-
-
-# On veut ajouter la nouvelle base de données, que l'on vient de créer dans dossier Data
-from pathlib import Path
-
-# dossier racine du projet = 3 niveaux au-dessus de ce fichier
-try:
-    PROJECT_ROOT = Path(__file__).resolve().parents[2]
-except NameError:
-    PROJECT_ROOT = Path.cwd().parents[1]
+    df['periode'] = np.select(conditions2, values2, default='Other')
+    return(df)
 
-data_dir = PROJECT_ROOT / "Data"
-data_dir.mkdir(exist_ok=True)
+# un département prêt à être assemblé : année et mois (devenus index) redeviennent des variables
+def partie_dpt(df_filtre, DEP):
+    return(ajoute_saison_periode(agrege_dpt(df_filtre, DEP).reset_index()))
 
-output_path = data_dir / "data_climat.csv"
-base_temp.to_csv(output_path, index=False)
 
-print("Fichier climat sauvegardé dans :", output_path)
\ No newline at end of file
+# construction de la base climat (étapes et mode incrémental : voir construction.py)
+if __name__ == "__main__":
+    try:
+        from .construction import construire
+    except ImportError:
+        from construction import construire
+    construire(sources=["climat"])
@@ -0,0 +1,185 @@
+# séries quotidiennes de Météo-France (fichiers QUOT) : on en tire nos propres seuils
+# (par exemple les épisodes de chaleur), qu'on ne trouve pas dans les fichiers mensuels MENS
+# un fichier quotidien est environ 30 fois plus gros que le fichier mensuel du département :
+# il n'est jamais chargé en entier. On le lit par morceaux et on ne garde, d'un morceau à
+# l'autre, que
+# - les sommes partielles par station et par mois (sommes des températures, nombres de jours
+#   au-delà des seuils, nombres de jours mesurés)
+# - pour chaque station, les jours de l'épisode de chaleur éventuellement en cours à la fin du
+#   morceau (un épisode peut commencer dans un morceau et finir dans le suivant)
+# - le dernier jour lu de chaque station
+# le résultat a le même schéma mensuel que data_climat (AAAA, MM, TM, TX, NBJTX0, ..., DEP,
+# saison, periode), plus les colonnes des épisodes (NBJVAGUE30, NBVAGUE30)
+
+import operator
+import os
+
+import numpy as np
+import pandas as pd
+
+try:
+    from . import api_donnees_climat as climat
+    from .fonctions import recup_url, filtre_data, schema
+except ImportError:
+    import api_donnees_climat as climat
+    from fonctions import recup_url, filtre_data, schema
+
+
+# adresse des fichiers quotidiens ; PROJET_URL_QUOT permet de pointer vers un autre serveur
+URL_QUOT = os.environ.get("PROJET_URL_QUOT",
+                          "https://object.files.data.gouv.fr/meteofrance/data/synchro_ftp/BASE/QUOT/")
+
+cols_quot = ["NUM_POSTE", "AAAAMMJJ", "TN", "TX"]
+dtypes_quot = {"NUM_POSTE": "int64", "AAAAMMJJ": "int32", "TN": "float64", "TX": "float64"}
+
+# nombres de jours au-delà d'un seuil : nom de la colonne -> (variable, comparaison, seuil)
+# (mêmes définitions que les colonnes NBJTX des fichiers mensuels)
+SEUILS = {
+    "NBJTX0": ("TX", "<=", 0),
+    "NBJTX25": ("TX", ">=", 25),
+    "NBJTX30": ("TX", ">=", 30),
+    "NBJTX35": ("TX", ">=", 35),
+}
+
+# épisodes : suffixe -> (variable, seuil, durée minimale en jours consécutifs)
+# NBJ<suffixe> : jours du mois appartenant à un épisode ; NB<suffixe> : épisodes commencés dans le mois
+VAGUES = {"VAGUE30": ("TX", 30, 3)}
+
+# une station ne compte pour un mois que si elle a au moins JOURS_MIN jours de TX mesurés
+JOURS_MIN = 20
+
+COMPARAISONS = {"<=": operator.le, ">=": operator.ge, "<": operator.lt, ">": operator.gt}
+
+
+def url_quot(DEP):
+    return(URL_QUOT + "Q_" + DEP + "_previous-1950-2023_RR-T-Vent.csv.gz")
+
+
+def colonnes_vagues(vagues=VAGUES):
+    return([prefixe + nom for nom in vagues for prefixe in ["NBJ", "NB"]])
+
+
+class AgregatQuotidien:
+    """Sommes mensuelles par station, mises à jour morceau par morceau (voir ajouter)."""
+
+    def __init__(self, seuils=SEUILS, vagues=VAGUES):
+        self.seuils = seuils
+        self.vagues = vagues
+        self.parties = []
+        self.dernier_jour = pd.Series(dtype="int64")
+        vide = pd.DataFrame({"poste": np.array([], dtype="int64"), "jour": np.array([], dtype="int64"),
+                             "aaaamm": np.array([], dtype="int64")})
+        self.en_cours = {nom: vide for nom in vagues}
+
+    def ajouter(self, morceau):
+        morceau = filtre_data.filtre_aaaammjj(morceau)
+        if morceau.empty:
+            return
+        poste = morceau["NUM_POSTE"].to_numpy(dtype="int64")
+        date = morceau["AAAAMMJJ"].to_numpy(dtype="int64")
+        aaaamm = date // 100
+        # numéro du jour (jours depuis 1970) : deux jours consécutifs ont des numéros qui se suivent
+        jour = pd.to_datetime(pd.DataFrame({"year": date // 10000, "month": aaaamm % 100, "day": date % 100})) \
+            .to_numpy().astype("datetime64[D]").astype("int64")
+        valeurs = {"TN": morceau["TN"].to_numpy(dtype="float64"), "TX": morceau["TX"].to_numpy(dtype="float64")}
+        valeurs["TM"] = (valeurs["TN"] + valeurs["TX"]) / 2
+
+        # sommes par station et par mois (les comparaisons avec NaN sont fausses : jour non compté)
+        colonnes = {}
+        for var in ["TX", "TM"]:
+            colonnes["n_" + var] = ~np.isnan(valeurs[var])
+            colonnes[var] = np.nan_to_num(valeurs[var])
+        for nom, (var, comparaison, seuil) in self.seuils.items():
+            colonnes[nom] = COMPARAISONS[comparaison](valeurs[var], seuil)
+        self.parties.append(pd.DataFrame(colonnes).groupby([poste, aaaamm]).sum())
+
+        derniers = pd.Series(jour).groupby(poste).max()
+        self.dernier_jour = pd.concat([self.dernier_jour, derniers]).groupby(level=0).max()
+        for nom, (var, seuil, duree) in self.vagues.items():
+            dans_vague = valeurs[var] >= seuil
+            self._episodes(nom, duree, poste[dans_vague], jour[dans_vague], aaaamm[dans_vague])
+
+    # épisodes de la vague `nom` : jours au-dessus du seuil, suite à ceux gardés du morceau précédent
+    # les épisodes terminés sont comptés, ceux qui touchent le dernier jour lu de leur station
+    # sont gardés pour le morceau suivant (fin=True : fin du fichier, tout est compté)
+    def _episodes(self, nom, duree, poste, jour, aaaamm, fin=False):
+        precedents = self.en_cours[nom]
+        p = np.concatenate([precedents["poste"].to_numpy(), poste])
+        j = np.concatenate([precedents["jour"].to_numpy(), jour])
+        m = np.concatenate([precedents["aaaamm"].to_numpy(), aaaamm])
+        ordre = np.lexsort((j, p))
+        p, j, m = p[ordre], j[ordre], m[ordre]
+
+        # un épisode commence à chaque changement de station ou jour non consécutif
+        nouveau = np.ones(len(p), dtype=bool)
+        nouveau[1:] = (p[1:] != p[:-1]) | (j[1:] != j[:-1] + 1)
+        episode = np.cumsum(nouveau) - 1
+        debuts = np.flatnonzero(nouveau)
+        derniers = np.append(debuts[1:] - 1, len(p) - 1)[:len(debuts)]
+        longueurs = derniers - debuts + 1
+        if fin:
+            ouvert = np.zeros(len(debuts), dtype=bool)
+        else:
+            ouvert = j[derniers] == self.dernier_jour.reindex(p[derniers]).to_numpy()
+
+        compte = ~ouvert & (longueurs >= duree)
+        jours = compte[episode]
+        nb_jours = pd.Series(1, index=[p[jours], m[jours]]).groupby(level=[0, 1]).sum()
+        nb_episodes = pd.Series(1, index=[p[debuts[compte]], m[debuts[compte]]]).groupby(level=[0, 1]).sum()
+        self.parties.append(pd.DataFrame({"NBJ" + nom: nb_jours, "NB" + nom: nb_episodes}))
+
+        garder = ouvert[episode]
+        self.en_cours[nom] = pd.DataFrame({"poste": p[garder], "jour": j[garder], "aaaamm": m[garder]})
+
+    # table mensuelle par station (NUM_POSTE, AAAAMM, TM, TX, NBJTX0, ...), comme un fichier MENS
+    def resultat(self):
+        for nom, (var, seuil, duree) in self.vagues.items():
+            vide = np.array([], dtype="int64")
+            self._episodes(nom, duree, vide, vide, vide, fin=True)
+
+        noms_vagues = colonnes_vagues(self.vagues)
+        if not self.parties:
+            return(pd.DataFrame(columns=["NUM_POSTE", "AAAAMM"] + climat.cols_indic + noms_vagues))
+        sommes = pd.concat(self.parties).groupby(level=[0, 1]).sum(min_count=1)
+        sommes = sommes.reindex(columns=["n_TX", "TX", "n_TM", "TM"] + list(self.seuils) + noms_vagues)
+        sommes = sommes.loc[sommes["n_TX"].notna()]
+
+        # moyennes des températures, jours comptés à 0 pour les mois sans épisode,
+        # NaN pour les mois trop incomplets
+        df = sommes[list(self.seuils) + noms_vagues].fillna(0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            df["TX"] = sommes["TX"] / sommes["n_TX"]
+            df["TM"] = sommes["TM"] / sommes["n_TM"]
+        df.loc[sommes["n_TX"] < JOURS_MIN] = np.nan
+        df.loc[sommes["n_TM"] < JOURS_MIN, "TM"] = np.nan
+        # pas de relevé de neige dans les fichiers RR-T-Vent
+        df["NBJNEIG"] = np.nan
+        df.index.names = ["NUM_POSTE", "AAAAMM"]
+        return(df.reset_index()[["NUM_POSTE", "AAAAMM"] + climat.cols_indic + noms_vagues])
+
+
+# lecture du fichier quotidien d'un département, morceau par morceau
+# résultat : table mensuelle par station, qui passe ensuite par le même calcul que les
+# fichiers mensuels (partie_quot)
+def lire_quot(DEP, session=None, chunksize=500_000, seuils=SEUILS, vagues=VAGUES):
+    agregat = AgregatQuotidien(seuils, vagues)
+    for morceau in recup_url.morceaux_csv_gz(url_quot(DEP), cols_quot, dtypes_quot, chunksize, session):
+        agregat.ajouter(morceau)
+    return(agregat.resultat())
+
+
+# un département prêt à être assemblé (base data_climat_quot)
+def partie_quot(df_stations, DEP, vagues=VAGUES):
+    noms_vagues = colonnes_vagues(vagues)
+    df = climat.agrege_dpt(df_stations, DEP, colonnes=climat.cols_indic + noms_vagues)
+    df[noms_vagues] = df[noms_vagues].astype(schema.TYPES["TX"])
+    return(climat.ajoute_saison_periode(df.reset_index()))
+
+
+# construction de la base data_climat_quot (étapes et mode incrémental : voir construction.py)
+if __name__ == "__main__":
+    try:
+        from .construction import construire
+    except ImportError:
+        from construction import construire
+    construire(sources=["quotidien"])
@@ -1,6 +1,11 @@
-import pandas as pd
+import os
 import numpy as np
-from fonctions import recup_url, filtre_data
+
+# importable comme module (src.import_data.api_donnees_tourisme) ou lancé depuis src/import_data
+try:
+    from .fonctions import recup_url, filtre_data, schema
+except ImportError:
+    from fonctions import recup_url, filtre_data, schema
 
 cols = [
     'ACTIVITY',
@@ -20,63 +25,41 @@ cols = [
     'OBS_VALUE'
 ]
 
-df = recup_url.url_to_df(url = "https://www.data.gouv.fr/api/1/datasets/r/1129fd80-2564-452c-86d4-9e36e7cca4a5",
-                          cols_a_conserver=cols,
-                          type_zip="zip",
-                          plusieurs_fichiers=True)
-
-# on applique le facteur d'échelle 
-df["OBS_VALUE_CORR"] = df["OBS_VALUE"] * (10 ** df["UNIT_MULT"])
-
-# on met le bon nombre de décimales
-df.loc[df["OBS_VALUE_CORR"].notna(), "OBS_VALUE_CORR"] = df.loc[df["OBS_VALUE_CORR"].notna()].apply(
-    lambda x: round(x["OBS_VALUE_CORR"], int(x["DECIMALS"])),
-    axis=1
-)
-
-# on garde seulement la valeur observée qui est corrigée
-df = df.drop(columns=["DECIMALS", "UNIT_MULT", "OBS_VALUE"])
-
-# on choisit le nombre d'arrivée comme indicateur
-df = df.loc[df['TOUR_MEASURE'].isin(["ARR"])]
-
-df = df.loc[df['OBS_STATUS'].isin(["A", "P"])]
-# on exclut les valeurs manquantes (O), A= Normale (définitive/validée), P= Valeur provisoire
-# en faisant: print(df["OBS_STATUS"].value_counts(dropna=False))
-# on obtient OBS_STATUS; A 69627; Name: count, dtype: int64
-# il n'y a donc pas de P, on va pouvoir supprimer la colonne OBS_STATUS
-df = df.drop(columns=["OBS_STATUS"])
-
-# on remarque que certaines valeurs définitives sont marquées Prov sous OBS_STATUS_FR
-# A = valeur correcte du point de vue technique,
-# mais OBS_STATUS_FR = "PROV" = pas encore consolidée statistiquement.
-# en faisant: print(df["CONF_STATUS"].value_counts(dropna=False))
-# on obtient CONF_STATUS; F 69627; Name: count, dtype: int64
-# il n'y a donc que des observations diffusables, on va pouvoir supprimer la colonne CONF_STATUS
-df = df.drop(columns=["CONF_STATUS","TOUR_MEASURE","OBS_STATUS_FR"])
-
-# On prend les données mensuelles et on supprime la colonne FREQ
-df = df.loc[df['FREQ'].isin(["M"])]
-df = df.drop("FREQ", axis = 1)
+# colonnes de codes en catégories (peu de modalités répétées sur des dizaines de milliers de lignes)
+dtypes = {c: "category" for c in cols if c not in ["DECIMALS", "UNIT_MULT", "OBS_VALUE"]}
+dtypes |= {"DECIMALS": "float32", "UNIT_MULT": "float32", "OBS_VALUE": "float64"}
 
-# On définit les années que l'on veut garder
-# on crée une variable ne contenant que l'annee et une autre le mois
-df['AAAA'] = df['TIME_PERIOD'].astype(str).str[:4].astype(int)
-df['MM']= df['TIME_PERIOD'].astype(str).str[5:7].astype(int)
-df = df.drop("TIME_PERIOD", axis = 1)
+# on ne garde, dès la lecture, que les arrivées mensuelles par département
+def filtre_lignes(df):
+    return(df.loc[(df["FREQ"] == "M") & (df["GEO_OBJECT"] == "DEP") & (df["TOUR_MEASURE"] == "ARR")])
 
-#on filtre les données sur nos mois d'interet
-df = filtre_data.filtre_annee_mois(df)
+# archive INSEE ; PROJET_URL_INSEE permet de pointer vers un autre serveur (voir serveur_local.py)
+URL_INSEE = os.environ.get("PROJET_URL_INSEE",
+                           "https://www.data.gouv.fr/api/1/datasets/r/1129fd80-2564-452c-86d4-9e36e7cca4a5")
 
-# On prend les données de departement et on supprime c
-df = df.loc[df['GEO_OBJECT'].isin(["DEP"])]
-df = df.drop("GEO_OBJECT", axis = 1)
-
-# on supprime TERRTYPO car tout est identique
-df = df.drop("TERRTYPO", axis = 1)
-
-# on exclut les DOM TOM
-df = df.loc[df['GEO'].str.len() == 2]
+def lire_tourisme(session=None):
+    return(recup_url.url_to_df(url = URL_INSEE,
+                          cols_a_conserver=cols,
+                          type_zip="zip",
+                          plusieurs_fichiers=True,
+                          session=session,
+                          dtype=dtypes,
+                          chunksize=200_000,
+                          filtre_lignes=filtre_lignes))
+
+# correction des valeurs observées : facteur d'échelle puis nombre de décimales de chaque ligne
+# plutôt qu'un arrondi ligne par ligne, on fait un arrondi vectorisé par nombre de décimales
+# (il n'y en a que quelques-uns différents dans la base)
+def corrige_valeurs(df):
+    valeur = (df["OBS_VALUE"] * (10.0 ** df["UNIT_MULT"].astype("float64"))).to_numpy()
+    decimales = df["DECIMALS"].to_numpy()
+    valeur_corr = valeur.copy()
+    for d in np.unique(decimales[~np.isnan(decimales)]):
+        masque = decimales == d
+        valeur_corr[masque] = np.round(valeur[masque], int(d))
+    df["OBS_VALUE_CORR"] = valeur_corr
+    # on garde seulement la valeur observée qui est corrigée
+    return(df.drop(columns=["DECIMALS", "UNIT_MULT", "OBS_VALUE"]))
 
 DEP_NOM = {
     "01": "Ain", "02": "Aisne", "03": "Allier", "04": "Alpes-de-Haute-Provence",
@@ -106,72 +89,106 @@ DEP_NOM = {
     "976": "Mayotte"
 }
 
-df.insert(
-    1,  # position (0 = première colonne, 1 = deuxième, etc.)
-    "DEP_NOM",  # nom de la nouvelle colonne
-    df["GEO"].map(DEP_NOM)
-)
 
-#changer le nom de la colonne GEO en DEP pour la fusion
-col = df.columns.tolist()
-col[2] = "DEP"
-df.columns = col
+# à partir des données lues, on construit les deux bases tourisme :
+# arrivées totales (base_touri) et arrivées selon l'origine des touristes (base_touri2)
+def prepare_tourisme(df):
+    # on choisit le nombre d'arrivée comme indicateur (lignes déjà filtrées à la lecture)
+
+    df = df.loc[df['OBS_STATUS'].isin(["A", "P"])]
+    # on exclut les valeurs manquantes (O), A= Normale (définitive/validée), P= Valeur provisoire
+    # en faisant: print(df["OBS_STATUS"].value_counts(dropna=False))
+    # on obtient OBS_STATUS; A 69627; Name: count, dtype: int64
+    # il n'y a donc pas de P, on va pouvoir supprimer la colonne OBS_STATUS
+    df = df.drop(columns=["OBS_STATUS"])
+
+    # on remarque que certaines valeurs définitives sont marquées Prov sous OBS_STATUS_FR
+    # A = valeur correcte du point de vue technique,
+    # mais OBS_STATUS_FR = "PROV" = pas encore consolidée statistiquement.
+    # en faisant: print(df["CONF_STATUS"].value_counts(dropna=False))
+    # on obtient CONF_STATUS; F 69627; Name: count, dtype: int64
+    # il n'y a donc que des observations diffusables, on va pouvoir supprimer la colonne CONF_STATUS
+    df = df.drop(columns=["CONF_STATUS","TOUR_MEASURE","OBS_STATUS_FR"])
+
+    # On prend les données mensuelles (filtrées à la lecture) et on supprime la colonne FREQ
+    df = df.drop("FREQ", axis = 1)
+
+    # On définit les années que l'on veut garder
+    # on crée une variable ne contenant que l'annee et une autre le mois
+    # (TIME_PERIOD est catégoriel : la conversion ne porte que sur ses modalités distinctes)
+    df['AAAA'] = df['TIME_PERIOD'].map(lambda p: int(p[:4])).astype(schema.TYPES['AAAA'])
+    df['MM']= df['TIME_PERIOD'].map(lambda p: int(p[5:7])).astype(schema.TYPES['MM'])
+    df = df.drop("TIME_PERIOD", axis = 1)
+
+    #on filtre les données sur nos mois d'interet
+    df = filtre_data.filtre_annee_mois(df)
+
+    # On prend les données de departement (filtrées à la lecture) et on supprime c
+    df = df.drop("GEO_OBJECT", axis = 1)
 
-# En faisant print(df["UNIT_LOC_RANKING"].value_counts(dropna=False)), 
-# seul "_T" apparaît, c'est à dire que l'on a aucune donnée sur le nombre d'étoile de nos hébergements à cause des varaiables choisies
-# on peut supprimer la colonne
-df = df.drop(columns=["UNIT_LOC_RANKING"])
+    # on supprime TERRTYPO car tout est identique
+    df = df.drop("TERRTYPO", axis = 1)
 
-dl = df #on enregistre la base à ce instant pour l'utiliser après
-# la variable "TOUR_RESID" donne l'origine du touriste : on filtre sur total (on ne distingue pas pour l'instant)
-df = df.loc[df['TOUR_RESID'].isin(["_T"])]
+    # on exclut les DOM TOM
+    df = df.loc[df['GEO'].str.len() == 2]
 
-# print(df["ACTIVITY"].value_counts(dropna=False))
-# Aucun camping n'est présent dans notre sélection
+    # on corrige les valeurs une fois les filtres appliqués : on ne traite que les lignes conservées
+    df = corrige_valeurs(df)
 
-# on somme les arrivées par année et mois
-df = df.groupby(['AAAA','MM', 'DEP', 'DEP_NOM'])["OBS_VALUE_CORR"].sum()
+    df.insert(
+        1,  # position (0 = première colonne, 1 = deuxième, etc.)
+        "DEP_NOM",  # nom de la nouvelle colonne
+        df["GEO"].map(DEP_NOM)
+    )
 
-# on remet année et mois (devenues index) en variables normales
-df = df.reset_index() 
+    #changer le nom de la colonne GEO en DEP pour la fusion
+    col = df.columns.tolist()
+    col[2] = "DEP"
+    df.columns = col
 
-base_touri = df
+    # En faisant print(df["UNIT_LOC_RANKING"].value_counts(dropna=False)), 
+    # seul "_T" apparaît, c'est à dire que l'on a aucune donnée sur le nombre d'étoile de nos hébergements à cause des varaiables choisies
+    # on peut supprimer la colonne
+    df = df.drop(columns=["UNIT_LOC_RANKING"])
 
-# On veut mettre notre nouvelle base de données dans Data 
-from pathlib import Path
+    dl = df #on enregistre la base à ce instant pour l'utiliser après
+    # la variable "TOUR_RESID" donne l'origine du touriste : on filtre sur total (on ne distingue pas pour l'instant)
+    df = df.loc[df['TOUR_RESID'].isin(["_T"])]
 
-PROJECT_ROOT = Path(__file__).resolve().parents[2]
-data_dir = PROJECT_ROOT / "Data"
-data_dir.mkdir(exist_ok=True)
+    # print(df["ACTIVITY"].value_counts(dropna=False))
+    # Aucun camping n'est présent dans notre sélection
 
-output_path = data_dir / "data_tourisme.csv"
-base_touri.to_csv(output_path, index=False)
+    # on somme les arrivées par année et mois
+    # (observed=True : on ne crée pas de lignes pour les modalités absentes des colonnes catégorielles)
+    df = df.groupby(['AAAA','MM', 'DEP', 'DEP_NOM'], observed=True)["OBS_VALUE_CORR"].sum()
 
-print("Fichier tourisme sauvegardé dans :", output_path)
+    # on remet année et mois (devenues index) en variables normales
+    df = df.reset_index() 
 
-# Mainenant nous allons considérer l'origine des touristes dans un dataframe à part
-# la variable "TOUR_RESID" donne l'origine du touriste : on remarque que total prend en compte Français ou Etranger
-# Ainsi on enlève total pour considérer l'origine des touristes
-dl = dl[dl["TOUR_RESID"] != "_T"]
+    base_touri = schema.appliquer(df)
 
-# on renomme 
-dl['TOUR_RESID'] = dl['TOUR_RESID'].replace(['250', '1_X_250'],['France', 'Étranger'])
+    # Mainenant nous allons considérer l'origine des touristes dans un dataframe à part
+    # la variable "TOUR_RESID" donne l'origine du touriste : on remarque que total prend en compte Français ou Etranger
+    # Ainsi on enlève total pour considérer l'origine des touristes
+    dl = dl[dl["TOUR_RESID"] != "_T"]
 
-# on somme les arrivées par année et mois
-dl = dl.groupby(['AAAA','MM', 'DEP', 'DEP_NOM','TOUR_RESID'])["OBS_VALUE_CORR"].sum()
+    # on renomme 
+    dl['TOUR_RESID'] = dl['TOUR_RESID'].cat.rename_categories({'250': 'France', '1_X_250': 'Étranger'})
 
-# on remet année et mois (devenues index) en variables normales
-dl = dl.reset_index() 
+    # on somme les arrivées par année et mois
+    dl = dl.groupby(['AAAA','MM', 'DEP', 'DEP_NOM','TOUR_RESID'], observed=True)["OBS_VALUE_CORR"].sum()
 
-base_touri2 = dl
-# On veut mettre notre nouvelle base de données dans Data 
-from pathlib import Path
+    # on remet année et mois (devenues index) en variables normales
+    dl = dl.reset_index() 
 
-PROJECT_ROOT = Path(__file__).resolve().parents[2]
-data_dir = PROJECT_ROOT / "Data"
-data_dir.mkdir(exist_ok=True)
+    base_touri2 = schema.appliquer(dl)
+    return(base_touri, base_touri2)
 
-output_path = data_dir / "data_tourisme2.csv"
-base_touri2.to_csv(output_path, index=False)
 
-print("Fichier tourisme sauvegardé dans :", output_path)
\ No newline at end of file
+# construction des bases tourisme (étapes et mode incrémental : voir construction.py)
+if __name__ == "__main__":
+    try:
+        from .construction import construire
+    except ImportError:
+        from construction import construire
+    construire(sources=["tourisme"])
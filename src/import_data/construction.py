@@ -0,0 +1,270 @@
+# construction des bases du dossier Data/ en cinq étapes successives :
+#   telechargement -> lecture -> agregation -> fusion -> ecriture
+# - telechargement : fichiers sources dans le cache disque (cache_http) et empreinte de chacun
+# - lecture : lignes et colonnes utiles de chaque fichier, gardées en Parquet (Data/etapes/lecture/)
+# - agregation : bases data_climat, data_tourisme et data_tourisme2 (une partition par département)
+#   et, si la source "quotidien" est demandée, data_climat_quot (voir api_donnees_climat_quot)
+# - fusion : lignes de la base fusionnée pour les départements modifiés
+# - ecriture : base fusionnée (Data/base) et fichiers csv
+# chaque étape note dans Data/manifeste.json l'empreinte des sources qui ont produit son résultat :
+# tant qu'elles n'ont pas changé (et que le résultat existe), l'étape n'est pas refaite.
+# Sans changement des sources, une construction se limite donc à revalider les fichiers
+# auprès des serveurs.
+#
+# depuis la racine du projet :
+#   python -m src.import_data.construction [--dossier Data] [--sources climat tourisme quotidien]
+#                                          [--jusqua fusion] [--forcer]
+# ou depuis python / le notebook :
+#   from src.import_data import construction
+#   construction.construire()
+#
+# après une modification du code d'une étape, --forcer refait toutes les étapes
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+
+try:
+    from . import api_donnees_climat as climat
+    from . import api_donnees_climat_quot as quot
+    from . import api_donnees_tourisme as tourisme
+    from .fonctions import assemblage, cache_http, manifeste, recup_url, schema, stockage
+except ImportError:
+    import api_donnees_climat as climat
+    import api_donnees_climat_quot as quot
+    import api_donnees_tourisme as tourisme
+    from fonctions import assemblage, cache_http, manifeste, recup_url, schema, stockage
+
+
+ETAPES = ["telechargement", "lecture", "agregation", "fusion", "ecriture"]
+SOURCES = ["climat", "tourisme"]
+# fichiers quotidiens (beaucoup plus gros) : seulement si on les demande
+SOURCES_OPTIONNELLES = ["quotidien"]
+# place laissée en plus des fichiers d'une construction dans le cache de téléchargements
+MARGE_CACHE = 1.1
+
+# bases exportées en csv à l'étape d'écriture
+EXPORTS_CSV = ["data_climat", "data_tourisme", "data_tourisme2", "data_climat_quot"]
+
+# sources lues département par département : base produite et fonctions de lecture et d'agrégation
+PAR_DEPARTEMENT = {
+    "climat": ("data_climat", climat.url_dpt, climat.lire_dpt, climat.partie_dpt),
+    "quotidien": ("data_climat_quot", quot.url_quot, quot.lire_quot, quot.partie_quot),
+}
+
+
+# une source = un fichier téléchargé : "climat/01", ..., "climat/95", "quotidien/01", ... et "tourisme"
+def unites(sources, deps_climat=None):
+    liste = []
+    for source in PAR_DEPARTEMENT:
+        if source in sources:
+            liste += [source + "/" + DEP for DEP in (deps_climat or climat.LISTE_DEP)]
+    if "tourisme" in sources:
+        liste.append("tourisme")
+    return(liste)
+
+
+def url_unite(unite):
+    if unite == "tourisme":
+        return(tourisme.URL_INSEE)
+    source, DEP = unite.split("/")
+    return(PAR_DEPARTEMENT[source][1](DEP))
+
+
+def chemin_lecture(unite, dossier):
+    return(Path(dossier) / "etapes" / "lecture" / (unite.replace("/", "_") + ".parquet"))
+
+
+# l'étape `etape` est à refaire pour `unite` si l'empreinte de sa source a changé depuis
+# la dernière fois ou si son résultat n'existe plus
+def a_refaire(manif, etape, unite, empreinte, resultat_existe, forcer=False):
+    return(forcer or manif.a_change(f"{etape}/{unite}", empreinte) or not resultat_existe)
+
+
+# ----------------------------------------------------------------------
+# étapes
+# ----------------------------------------------------------------------
+
+# les fichiers quotidiens (environ 30 fois un fichier mensuel chacun) dépassent vite la taille
+# maximale du cache de téléchargements (cache_http.TAILLE_MAX). S'ils n'y tenaient pas tous, les
+# premiers seraient évincés avant l'étape de lecture, puis retéléchargés en entier à chaque
+# construction au lieu d'être simplement revalidés. On additionne donc la taille des fichiers de
+# la construction (celle du cache, sinon celle annoncée par le serveur, requête HEAD) et on
+# agrandit le cache d'autant si besoin, pour la durée du programme. Renvoie la taille nécessaire.
+def ajuster_taille_cache(liste_unites, session, cache, max_workers=8):
+    if cache.hors_ligne:
+        return(cache.taille_max)
+
+    def taille(unite):
+        entree = cache.entree(url_unite(unite))
+        if entree is not None:
+            return(entree["taille"])
+        reponse = session.head(url_unite(unite), allow_redirects=True)
+        reponse.raise_for_status()
+        return(int(reponse.headers.get("Content-Length", 0)))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        besoin = int(sum(executor.map(taille, liste_unites)) * MARGE_CACHE)
+    cache.taille_max = max(cache.taille_max, besoin)
+    return(besoin)
+
+
+# empreinte sha256 de chaque fichier source ; le fichier n'est retéléchargé que s'il a changé
+def etape_telechargement(liste_unites, session, max_workers=8):
+    cache = cache_http.cache_defaut()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        empreintes = executor.map(lambda u: cache.empreinte(url_unite(u), session), liste_unites)
+        return(dict(zip(liste_unites, empreintes)))
+
+
+# lecture des fichiers dont l'empreinte a changé ; renvoie les unités relues
+def etape_lecture(empreintes, dossier, manif, session, forcer=False, max_workers=8):
+    a_lire = [u for u, e in empreintes.items()
+              if a_refaire(manif, "lecture", u, e, chemin_lecture(u, dossier).exists(), forcer)]
+
+    def lire(unite):
+        if unite == "tourisme":
+            df = tourisme.lire_tourisme(session)
+        else:
+            source, DEP = unite.split("/")
+            df = PAR_DEPARTEMENT[source][2](DEP, session)
+        chemin = chemin_lecture(unite, dossier)
+        chemin.parent.mkdir(parents=True, exist_ok=True)
+        df.to_parquet(chemin, index=False)
+        manif.noter(f"lecture/{unite}", empreintes[unite])
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(lire, a_lire))
+    return(a_lire)
+
+
+# calcule les bases agrégées pour les sources relues ; renvoie pour chaque base
+# la liste des départements dont les partitions ont été réécrites
+def etape_agregation(empreintes, dossier, manif, forcer=False):
+    modifies = {}
+
+    # climat et quotidien : un fichier par département (la Corse, codée 20, donne les partitions 2A et 2B)
+    for source, (nom, _, _, partie) in PAR_DEPARTEMENT.items():
+        parties, refaites = [], []
+        for unite, empreinte in empreintes.items():
+            if unite.split("/")[0] != source:
+                continue
+            DEP = unite.split("/")[1]
+            existe = all(stockage.existe_partition(nom, code, dossier)
+                         for code in schema.codes_dep(DEP))
+            if a_refaire(manif, "agregation", unite, empreinte, existe, forcer):
+                parties.append((DEP, partie(pd.read_parquet(chemin_lecture(unite, dossier)), DEP)))
+                refaites.append((unite, empreinte))
+        if parties:
+            assemblage.assembler(parties, nom=nom, dossier=dossier)
+        # noté seulement une fois les partitions écrites
+        for unite, empreinte in refaites:
+            manif.noter(f"agregation/{unite}", empreinte)
+        modifies[nom] = [code for DEP, _ in parties for code in schema.codes_dep(DEP)]
+
+    # tourisme : une seule archive, mais on ne réécrit que les départements dont le contenu a changé
+    if "tourisme" in empreintes:
+        existe = stockage.existe("data_tourisme", dossier) and stockage.existe("data_tourisme2", dossier)
+        if a_refaire(manif, "agregation", "tourisme", empreintes["tourisme"], existe, forcer):
+            bases = tourisme.prepare_tourisme(pd.read_parquet(chemin_lecture("tourisme", dossier)))
+            for nom, base in zip(["data_tourisme", "data_tourisme2"], bases):
+                nouvelles = manifeste.partitions_modifiees(manif, nom, base)
+                deps = sorted(nouvelles)
+                if forcer or not stockage.existe(nom, dossier):
+                    deps = sorted(base["DEP"].astype(str).unique())
+                stockage.ecrire(base.loc[base["DEP"].isin(deps)], nom, dossier)
+                manifeste.noter_partitions(manif, nom, nouvelles)
+                modifies[nom] = deps
+            manif.noter("agregation/tourisme", empreintes["tourisme"])
+    return(modifies)
+
+
+# lignes de la base fusionnée à recalculer (départements modifiés dans l'une des deux bases)
+def etape_fusion(modifies, dossier, forcer=False):
+    deps = None if forcer else sorted(set(modifies.get("data_climat", [])) | set(modifies.get("data_tourisme", [])))
+    return(assemblage.fusion_partielle(deps, dossier))
+
+
+def etape_ecriture(base, modifies, dossier):
+    ecrits = []
+    if base is not None:
+        stockage.ecrire(base, "base", dossier)
+        ecrits.append("base")
+    for nom in EXPORTS_CSV:
+        chemin_csv = Path(dossier) / (nom + ".csv")
+        if stockage.existe(nom, dossier) and (modifies.get(nom) or not chemin_csv.exists()):
+            stockage.lire(nom, dossier=dossier).to_csv(chemin_csv, index=False)
+            ecrits.append(chemin_csv.name)
+    return(ecrits)
+
+
+# ----------------------------------------------------------------------
+# construction complète
+# ----------------------------------------------------------------------
+
+def construire(dossier=None, sources=SOURCES, deps_climat=None, jusqua="ecriture",
+               forcer=False, max_workers=8, verbeux=True):
+    """Construit (ou met à jour) les bases de `dossier` jusqu'à l'étape `jusqua` incluse.
+
+    Renvoie, pour chaque étape exécutée, ce qu'elle a refait."""
+    dossier = Path(dossier if dossier is not None else stockage.DOSSIER_DONNEES)
+    dossier.mkdir(parents=True, exist_ok=True)
+    derniere = ETAPES.index(jusqua)
+    manif = manifeste.Manifeste(dossier)
+    rapport = {}
+
+    def journal(etape, debut, refait):
+        rapport[etape] = refait
+        if verbeux:
+            print(f"{etape:<15} {len(refait):>4} élément(s) refait(s)  ({time.perf_counter() - debut:.1f} s)")
+
+    session = recup_url.creer_session(taille_pool=max_workers)
+    with session:
+        debut = time.perf_counter()
+        liste_unites = unites(sources, deps_climat)
+        if "quotidien" in sources:
+            cache = cache_http.cache_defaut()
+            taille_max = cache.taille_max
+            besoin = ajuster_taille_cache(liste_unites, session, cache, max_workers)
+            if verbeux and cache.taille_max > taille_max:
+                print(f"cache de téléchargements agrandi à {besoin / 1024**2:.0f} Mo pour les fichiers quotidiens")
+        empreintes = etape_telechargement(liste_unites, session, max_workers)
+        # "refait" = sources dont le contenu a changé depuis la dernière lecture
+        journal("telechargement", debut, [u for u, e in empreintes.items() if manif.a_change(f"lecture/{u}", e)])
+
+        if derniere >= 1:
+            debut = time.perf_counter()
+            journal("lecture", debut, etape_lecture(empreintes, dossier, manif, session, forcer, max_workers))
+
+    try:
+        if derniere >= 2:
+            debut = time.perf_counter()
+            modifies = etape_agregation(empreintes, dossier, manif, forcer)
+            journal("agregation", debut, [f"{nom}/DEP={d}" for nom, deps in modifies.items() for d in deps])
+
+        if derniere >= 3:
+            debut = time.perf_counter()
+            base = etape_fusion(modifies, dossier, forcer)
+            journal("fusion", debut, [] if base is None else sorted(base["DEP"].astype(str).unique()))
+
+        if derniere >= 4:
+            debut = time.perf_counter()
+            journal("ecriture", debut, etape_ecriture(base, modifies, dossier))
+    finally:
+        manif.enregistrer()
+    return(rapport)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Construction des bases climat et tourisme du dossier Data/")
+    parser.add_argument("--dossier", default=None, help="dossier des données (par défaut Data/ à la racine du projet)")
+    parser.add_argument("--sources", nargs="+", choices=SOURCES + SOURCES_OPTIONNELLES, default=SOURCES)
+    parser.add_argument("--jusqua", choices=ETAPES, default="ecriture", help="dernière étape exécutée")
+    parser.add_argument("--forcer", action="store_true", help="refait toutes les étapes")
+    parser.add_argument("--max-workers", type=int, default=8)
+    args = parser.parse_args()
+    construire(args.dossier, args.sources, jusqua=args.jusqua, forcer=args.forcer, max_workers=args.max_workers)
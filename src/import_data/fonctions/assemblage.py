@@ -0,0 +1,47 @@
+# assemblage de la base à partir des résultats calculés département par département
+# chaque département est traité séparément puis la base finale est construite en une seule
+# concaténation (et non en recopiant à chaque tour de boucle tout ce qui a déjà été accumulé)
+
+import pandas as pd
+from . import stockage, schema
+
+
+# la Corse est codée 20 dans les fichiers Météo-France : on duplique ses lignes
+# en 2A et 2B pour pouvoir cartographier les deux départements ensuite
+def partitions_corse(DEP, df):
+    return [(code, df.assign(DEP=code)) for code in schema.codes_dep(DEP)]
+
+
+# resultats : itérable de couples (code département, DataFrame du département)
+# si un nom de base est donné, chaque département y est aussi écrit dans sa propre partition
+# Parquet (Data/<nom>/DEP=01/, ...) au fur et à mesure qu'il arrive
+def assembler(resultats, nom=None, dossier=None):
+    parties = []
+    for DEP, df in resultats:
+        for code, partie in partitions_corse(DEP, df):
+            partie = schema.appliquer(partie)
+            if nom is not None:
+                stockage.ecrire(partie, nom, dossier)
+            parties.append(partie)
+
+    return(pd.concat(parties, ignore_index=True))
+
+
+# base fusionnée climat + tourisme (une ligne par département, année et mois du climat)
+def fusionner(climat, tourisme):
+    return(pd.merge(climat, tourisme, on=["DEP", "AAAA", "MM"], how="left"))
+
+
+# lignes de la base fusionnée pour les départements `deps` (tous si deps vaut None),
+# à écrire dans Data/base ; None s'il n'y a rien à faire (liste vide ou une des deux bases manque)
+def fusion_partielle(deps=None, dossier=None):
+    if not (stockage.existe("data_climat", dossier) and stockage.existe("data_tourisme", dossier)):
+        return(None)
+    # première construction : tous les départements
+    if not stockage.existe("base", dossier):
+        deps = None
+    if deps is not None and len(deps) == 0:
+        return(None)
+    climat = stockage.lire("data_climat", deps=deps, dossier=dossier)
+    tourisme = stockage.lire("data_tourisme", deps=deps, dossier=dossier)
+    return(fusionner(climat, tourisme))
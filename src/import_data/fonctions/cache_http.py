@@ -0,0 +1,313 @@
+# cache disque des fichiers téléchargés (fichiers Météo-France .gz, archive INSEE .zip)
+# - les contenus sont rangés par empreinte sha256 (objets/ab/abcdef...) : un même contenu
+#   n'est stocké qu'une fois, même s'il est servi par plusieurs urls
+# - un index json associe chaque url à son empreinte et aux en-têtes ETag / Last-Modified
+#   qui permettent de redemander le fichier au serveur seulement s'il a changé (réponse 304)
+# - au-delà d'une taille maximale, on supprime les fichiers utilisés le moins récemment
+# - plusieurs processus peuvent partager le cache : l'index est réécrit sous verrou de fichier,
+#   en fusionnant ce que chacun a modifié ; les dates d'accès (servies depuis le cache) ne sont
+#   enregistrées qu'au plus toutes les DELAI_ECRITURE secondes et à la fin du programme
+# - en mode hors ligne, on ne fait aucun appel réseau : on sert ce qui est déjà en cache
+
+import atexit
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import requests
+
+try:
+    import fcntl
+except ImportError:  # Windows : pas de verrou entre processus
+    fcntl = None
+
+
+# dossier racine du projet = 4 niveaux au-dessus de ce fichier
+DOSSIER_CACHE = Path(os.environ.get(
+    "PROJET_CACHE_HTTP",
+    Path(__file__).resolve().parents[3] / ".cache" / "telechargements"))
+TAILLE_MAX = int(os.environ.get("PROJET_CACHE_TAILLE_MAX", 2 * 1024**3))  # en octets
+HORS_LIGNE = os.environ.get("PROJET_HORS_LIGNE", "0") == "1"
+# durée (en secondes) pendant laquelle on ne revalide pas un fichier auprès du serveur
+DUREE_FRAICHEUR = float(os.environ.get("PROJET_CACHE_FRAICHEUR", 24 * 3600))
+# délai (en secondes) entre deux écritures de l'index pour les seules dates d'accès
+DELAI_ECRITURE = 60
+
+
+class HorsLigneError(RuntimeError):
+    pass
+
+
+class CacheTelechargements:
+    def __init__(self, dossier=DOSSIER_CACHE, taille_max=TAILLE_MAX,
+                 hors_ligne=HORS_LIGNE, duree_fraicheur=DUREE_FRAICHEUR):
+        self.dossier = Path(dossier)
+        self.taille_max = taille_max
+        self.hors_ligne = hors_ligne
+        self.duree_fraicheur = duree_fraicheur
+        self._verrou = threading.Lock()
+        (self.dossier / "objets").mkdir(parents=True, exist_ok=True)
+        self._index = self._lire_index()
+        # changements pas encore enregistrés : urls modifiées ou supprimées, dates d'accès
+        self._modifiees, self._supprimees, self._acces = set(), set(), {}
+        self._derniere_ecriture = time.time()
+        atexit.register(self.enregistrer)
+
+    # ------------------------------------------------------------------
+    # index url -> métadonnées
+    # ------------------------------------------------------------------
+    def _chemin_index(self):
+        return self.dossier / "index.json"
+
+    def _lire_index(self):
+        try:
+            with open(self._chemin_index(), encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    # (appelé avec self._verrou) : l'index sur disque est relu sous verrou de fichier et on n'y
+    # reporte que les changements faits ici, pour ne pas effacer ceux des autres processus
+    def _ecrire_index(self):
+        with _verrou_fichier(self.dossier / "index.lock"):
+            index = self._lire_index()
+            for url in self._supprimees:
+                index.pop(url, None)
+            for url in self._modifiees:
+                if url in self._index:
+                    index[url] = self._index[url]
+            for url, acces in self._acces.items():
+                if url in index:
+                    index[url]["dernier_acces"] = max(index[url].get("dernier_acces", 0), acces)
+            # écriture dans un fichier temporaire puis renommage : l'index n'est jamais à moitié écrit
+            fd, tmp = tempfile.mkstemp(dir=self.dossier, suffix=".json")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(index, f, indent=1)
+            os.replace(tmp, self._chemin_index())
+        self._index = index
+        self._modifiees, self._supprimees, self._acces = set(), set(), {}
+        self._derniere_ecriture = time.time()
+
+    def enregistrer(self):
+        """Enregistre les changements de l'index pas encore écrits (dates d'accès)."""
+        with self._verrou:
+            if (self._modifiees or self._supprimees or self._acces) and self.dossier.exists():
+                self._ecrire_index()
+
+    def chemin_objet(self, empreinte):
+        return self.dossier / "objets" / empreinte[:2] / empreinte
+
+    # ------------------------------------------------------------------
+    # téléchargement
+    # ------------------------------------------------------------------
+    def entree(self, url):
+        with self._verrou:
+            entree = self._index.get(url)
+        if entree is None or not self.chemin_objet(entree["sha256"]).exists():
+            return None
+        return entree
+
+    @contextmanager
+    def ouvrir(self, url, session=None):
+        """Fichier binaire du contenu de `url`, téléchargé ou revalidé si besoin.
+
+        Quand le contenu doit être téléchargé, il est lu au fil de la réponse HTTP
+        et recopié dans le cache en même temps : on ne garde jamais le fichier entier en mémoire."""
+        http = session if session is not None else requests
+        entree = self.entree(url)
+
+        if self.hors_ligne:
+            if entree is None:
+                raise HorsLigneError(f"mode hors ligne : {url} absent du cache")
+            with open(self._servir(url, entree, revalide=False), "rb") as f:
+                yield f
+            return
+
+        if entree is not None and time.time() - entree["date_validation"] < self.duree_fraicheur:
+            with open(self._servir(url, entree, revalide=False), "rb") as f:
+                yield f
+            return
+
+        # requête conditionnelle : le serveur répond 304 si le fichier n'a pas changé
+        entetes = {}
+        if entree is not None:
+            if entree.get("etag"):
+                entetes["If-None-Match"] = entree["etag"]
+            if entree.get("last_modified"):
+                entetes["If-Modified-Since"] = entree["last_modified"]
+
+        with http.get(url, headers=entetes, stream=True) as reponse:
+            if reponse.status_code == 304 and entree is not None:
+                with open(self._servir(url, entree, revalide=True), "rb") as f:
+                    yield f
+                return
+
+            reponse.raise_for_status()
+            reponse.raw.decode_content = True
+            flux = _FluxEnregistre(reponse.raw, self.dossier)
+            try:
+                yield flux
+                empreinte, taille = flux.terminer(self)
+            except BaseException:
+                flux.abandonner()
+                raise
+
+        entree = {
+            "sha256": empreinte,
+            "etag": reponse.headers.get("ETag"),
+            "last_modified": reponse.headers.get("Last-Modified"),
+            "taille": taille,
+        }
+        self._servir(url, entree, revalide=True)
+
+    def _servir(self, url, entree, revalide):
+        maintenant = time.time()
+        with self._verrou:
+            if not revalide:
+                # simple lecture depuis le cache : seule la date d'accès change, enregistrée plus tard
+                if url in self._index:
+                    self._index[url]["dernier_acces"] = maintenant
+                    self._acces[url] = maintenant
+                if maintenant - self._derniere_ecriture > DELAI_ECRITURE:
+                    self._ecrire_index()
+                return self.chemin_objet(entree["sha256"])
+            entree = dict(entree, dernier_acces=maintenant, date_validation=maintenant)
+            ancienne = self._index.get(url)
+            self._index[url] = entree
+            self._modifiees.add(url)
+            # le contenu de l'url a changé : l'ancien objet est supprimé s'il ne sert plus
+            if ancienne is not None and ancienne["sha256"] != entree["sha256"] \
+                    and all(e["sha256"] != ancienne["sha256"] for e in self._index.values()):
+                self.chemin_objet(ancienne["sha256"]).unlink(missing_ok=True)
+            self._evincer(garder=entree["sha256"])
+            self._ecrire_index()
+        return self.chemin_objet(entree["sha256"])
+
+    def telecharger(self, url, session=None):
+        with self.ouvrir(url, session) as f:
+            return f.read()
+
+    def chemin(self, url, session=None):
+        """Chemin local du contenu de `url` (téléchargé ou revalidé si besoin)."""
+        with self.ouvrir(url, session) as f:
+            while f.read(1024 * 1024):
+                pass
+        return self.chemin_objet(self.empreinte_connue(url))
+
+    def empreinte(self, url, session=None):
+        """Empreinte sha256 du contenu actuel de `url` (revalidé si besoin)."""
+        self.chemin(url, session)
+        return self.empreinte_connue(url)
+
+    def empreinte_connue(self, url):
+        with self._verrou:
+            return self._index[url]["sha256"]
+
+    # ------------------------------------------------------------------
+    # éviction
+    # ------------------------------------------------------------------
+    def _evincer(self, garder=None):
+        # on supprime les urls les moins récemment utilisées jusqu'à repasser sous la taille max
+        objets = {}
+        for url, entree in self._index.items():
+            objets.setdefault(entree["sha256"], []).append(url)
+        taille = sum(self._index[urls[0]]["taille"] for urls in objets.values())
+
+        par_anciennete = sorted(objets.items(),
+                                key=lambda o: max(self._index[u]["dernier_acces"] for u in o[1]))
+        for empreinte, urls in par_anciennete:
+            if taille <= self.taille_max:
+                break
+            if empreinte == garder:
+                continue
+            taille -= self._index[urls[0]]["taille"]
+            for u in urls:
+                del self._index[u]
+                self._supprimees.add(u)
+                self._modifiees.discard(u)
+            self.chemin_objet(empreinte).unlink(missing_ok=True)
+
+    def vider(self):
+        with self._verrou:
+            for entree in self._index.values():
+                self.chemin_objet(entree["sha256"]).unlink(missing_ok=True)
+            self._supprimees |= set(self._index)
+            self._modifiees = set()
+            self._index = {}
+            self._ecrire_index()
+
+
+# verrou exclusif entre processus, le temps d'un bloc with
+@contextmanager
+def _verrou_fichier(chemin):
+    with open(chemin, "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+# lecture d'une réponse HTTP qui recopie au passage les octets lus dans un fichier temporaire du cache
+class _FluxEnregistre(io.RawIOBase):
+    def __init__(self, source, dossier):
+        self._source = source
+        self._hash = hashlib.sha256()
+        self._taille = 0
+        fd, self._tmp = tempfile.mkstemp(dir=dossier, suffix=".part")
+        self._copie = os.fdopen(fd, "wb")
+
+    def readable(self):
+        return True
+
+    def readinto(self, tampon):
+        donnees = self._source.read(len(tampon))
+        n = len(donnees)
+        tampon[:n] = donnees
+        self._hash.update(donnees)
+        self._copie.write(donnees)
+        self._taille += n
+        return n
+
+    def terminer(self, cache):
+        # le lecteur (gzip, pandas) peut s'arrêter avant la fin de la réponse : on lit le reste
+        while self.read(1024 * 1024):
+            pass
+        self._copie.close()
+        empreinte = self._hash.hexdigest()
+        chemin = cache.chemin_objet(empreinte)
+        chemin.parent.mkdir(exist_ok=True)
+        os.replace(self._tmp, chemin)
+        return empreinte, self._taille
+
+    def abandonner(self):
+        self._copie.close()
+        Path(self._tmp).unlink(missing_ok=True)
+
+
+_cache_defaut = None
+_verrou_defaut = threading.Lock()
+
+
+def cache_defaut():
+    global _cache_defaut
+    with _verrou_defaut:
+        if _cache_defaut is None:
+            _cache_defaut = CacheTelechargements()
+    return _cache_defaut
+
+
+# remplace le cache utilisé par défaut (par exemple le temps d'un banc d'essai) ; rend l'ancien
+def changer_cache_defaut(cache):
+    global _cache_defaut
+    with _verrou_defaut:
+        ancien, _cache_defaut = _cache_defaut, cache
+    return ancien
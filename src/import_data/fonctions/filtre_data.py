@@ -1,5 +1,20 @@
+# fenêtre d'années étudiée
+ANNEE_DEBUT = 2011
+ANNEE_FIN = 2022
+
 # on sélectionne nos mois et années d'intérêt
 def filtre_annee_mois(df):
-    df = df[df.AAAA.isin(list(range(2011, 2023)))]
+    df = df[df.AAAA.isin(list(range(ANNEE_DEBUT, ANNEE_FIN + 1)))]
     df = df[df.MM.isin([x for x in range(1,13)])]
-    return(df)
\ No newline at end of file
+    return(df)
+
+# même filtre sur les années, directement sur la colonne AAAAMM des fichiers Météo-France
+# (utilisable morceau par morceau pendant la lecture)
+def filtre_aaaamm(df):
+    annee = df["AAAAMM"] // 100
+    return(df[(annee >= ANNEE_DEBUT) & (annee <= ANNEE_FIN)])
+
+# même filtre sur la colonne AAAAMMJJ des fichiers quotidiens
+def filtre_aaaammjj(df):
+    annee = df["AAAAMMJJ"] // 10000
+    return(df[(annee >= ANNEE_DEBUT) & (annee <= ANNEE_FIN)])
@@ -0,0 +1,65 @@
+# manifeste des sources déjà traitées (Data/manifeste.json)
+# pour chaque source (fichier département Météo-France, archive INSEE, partition d'une base)
+# on garde l'empreinte du contenu utilisé lors de la dernière construction :
+# une source dont l'empreinte n'a pas changé n'a pas besoin d'être retraitée
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from pathlib import Path
+
+import pandas as pd
+
+
+class Manifeste:
+    def __init__(self, dossier):
+        self.chemin = Path(dossier) / "manifeste.json"
+        self._verrou = threading.Lock()
+        try:
+            with open(self.chemin, encoding="utf-8") as f:
+                self._empreintes = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self._empreintes = {}
+
+    def a_change(self, cle, empreinte):
+        return self._empreintes.get(cle) != empreinte
+
+    def noter(self, cle, empreinte):
+        with self._verrou:
+            self._empreintes[cle] = empreinte
+
+    def enregistrer(self):
+        with self._verrou:
+            self.chemin.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.chemin.parent, suffix=".json")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(self._empreintes, f, indent=1, sort_keys=True)
+            os.replace(tmp, self.chemin)
+
+
+# empreinte du contenu d'un DataFrame (valeurs et noms de colonnes, indépendamment des types
+# et de l'ordre des lignes)
+def empreinte_df(df):
+    df = df.astype(str).sort_values(list(df.columns)).reset_index(drop=True)
+    h = hashlib.sha256(",".join(df.columns).encode())
+    h.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+# départements d'une base dont le contenu a changé depuis la dernière construction, avec leurs
+# nouvelles empreintes : {DEP: empreinte}. Rien n'est noté dans le manifeste : on appelle
+# noter_partitions une fois les partitions écrites (une écriture qui échoue sera refaite)
+def partitions_modifiees(manifeste, nom, df):
+    modifies = {}
+    for DEP, partie in df.groupby(df["DEP"].astype(str)):
+        empreinte = empreinte_df(partie)
+        if manifeste.a_change(f"{nom}/DEP={DEP}", empreinte):
+            modifies[DEP] = empreinte
+    return(modifies)
+
+
+def noter_partitions(manifeste, nom, empreintes):
+    for DEP, empreinte in empreintes.items():
+        manifeste.noter(f"{nom}/DEP={DEP}", empreinte)
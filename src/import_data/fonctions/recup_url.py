@@ -5,18 +5,102 @@ import gzip
 import zipfile
 import io
 import os
-
-
-def url_to_df(url, cols_a_conserver, type_zip, plusieurs_fichiers: bool):
+from contextlib import contextmanager
+from requests.adapters import HTTPAdapter
+from . import cache_http
+
+
+# session HTTP partagée : les connexions vers un même hôte sont réutilisées
+# (utile quand on télécharge plusieurs fichiers en parallèle)
+def creer_session(taille_pool=8):
+    session = requests.Session()
+    adaptateur = HTTPAdapter(pool_connections=taille_pool, pool_maxsize=taille_pool, max_retries=3)
+    session.mount("http://", adaptateur)
+    session.mount("https://", adaptateur)
+    return session
+
+
+# contenu brut du fichier : depuis le cache disque (cache_http) ou directement depuis le réseau
+def telecharger(url, session=None, cache=True):
+    if cache is True:
+        cache = cache_http.cache_defaut()
+    if cache:
+        return cache.telecharger(url, session)
+    # sans session fournie, on passe par le module requests (une connexion par appel)
+    http = session if session is not None else requests
+    return http.get(url).content
+
+
+# même chose sous forme de flux : le fichier est lu au fur et à mesure du téléchargement
+@contextmanager
+def ouvrir(url, session=None, cache=True):
+    if cache is True:
+        cache = cache_http.cache_defaut()
+    if cache:
+        with cache.ouvrir(url, session) as f:
+            yield f
+        return
+    http = session if session is not None else requests
+    with http.get(url, stream=True) as reponse:
+        reponse.raise_for_status()
+        reponse.raw.decode_content = True
+        yield reponse.raw
+
+
+# lecture d'un csv, éventuellement par morceaux de `chunksize` lignes :
+# filtre_lignes (fonction DataFrame -> DataFrame) est appliquée à chaque morceau,
+# on ne garde donc en mémoire que les lignes conservées
+def lire_csv(f, cols_a_conserver, dtype=None, chunksize=None, filtre_lignes=None):
+    if chunksize is None:
+        df = pd.read_csv(f, sep=";", usecols=cols_a_conserver, dtype=dtype)
+        return filtre_lignes(df) if filtre_lignes is not None else df
+
+    morceaux = []
+    for chunk in pd.read_csv(f, sep=";", usecols=cols_a_conserver, dtype=dtype, chunksize=chunksize):
+        if filtre_lignes is not None:
+            chunk = filtre_lignes(chunk)
+        morceaux.append(chunk)
+    return concat_categories(morceaux)
+
+
+# lecture d'un gros csv compressé morceau par morceau, sans jamais le garder en entier en mémoire :
+# chaque morceau de `chunksize` lignes est rendu dès qu'il est lu (décompression au fil du flux)
+def morceaux_csv_gz(url, cols_a_conserver, dtype=None, chunksize=500_000, session=None, cache=True):
+    with ouvrir(url, session, cache) as flux, gzip.open(flux) as file:
+        yield from pd.read_csv(file, sep=";", usecols=cols_a_conserver, dtype=dtype, chunksize=chunksize)
+
+
+# pd.concat transforme en object les colonnes catégorielles dont les modalités diffèrent
+# d'un morceau à l'autre : on aligne d'abord les modalités pour garder des colonnes catégorielles
+def concat_categories(frames):
+    frames = list(frames)
+    for col in frames[0].columns:
+        if not isinstance(frames[0][col].dtype, pd.CategoricalDtype):
+            continue
+        modalites = pd.api.types.union_categoricals(
+            [df[col].cat.remove_unused_categories() for df in frames], sort_categories=True).categories
+        frames = [df.assign(**{col: df[col].cat.set_categories(modalites)}) for df in frames]
+    return pd.concat(frames, ignore_index=True)
+
+
+def url_to_df(url, cols_a_conserver, type_zip, plusieurs_fichiers: bool, session=None, cache=True,
+              dtype=None, chunksize=None, filtre_lignes=None):
     # Cas fichier .gz (Météo France : un seul fichier CSV compressé)
+    # on décompresse au fil du téléchargement plutôt que de charger tout le fichier en mémoire
     if type_zip == "gz":
-        file = gzip.open(io.BytesIO(requests.get(url).content))
-        df = pd.read_csv(file, sep=";", usecols=cols_a_conserver)
+        with ouvrir(url, session, cache) as flux, gzip.open(flux) as file:
+            df = lire_csv(file, cols_a_conserver, dtype, chunksize, filtre_lignes)
         return df
 
     # Cas ZIP (data.gouv : plusieurs CSV possibles dans l'archive)
     elif type_zip == "zip":
-        z = zipfile.ZipFile(io.BytesIO(requests.get(url).content))
+        # le zip doit pouvoir être parcouru librement : on l'ouvre depuis le cache disque si possible
+        if cache is True:
+            cache = cache_http.cache_defaut()
+        if cache:
+            z = zipfile.ZipFile(cache.chemin(url, session))
+        else:
+            z = zipfile.ZipFile(io.BytesIO(telecharger(url, session, cache)))
 
         # Cas où on ne veut qu'un seul fichier : on prend le premier CSV
         if not plusieurs_fichiers:
@@ -24,7 +108,7 @@ def url_to_df(url, cols_a_conserver, type_zip, plusieurs_fichiers: bool):
             if not noms_csv:
                 raise ValueError("Aucun fichier CSV trouvé dans le ZIP.")
             with z.open(noms_csv[0]) as f:
-                df = pd.read_csv(f, sep=";", usecols=cols_a_conserver)
+                df = lire_csv(f, cols_a_conserver, dtype, chunksize, filtre_lignes)
             return df
 
         # plusieurs_fichiers == True : on cherche tous les CSV compatibles
@@ -32,12 +116,15 @@ def url_to_df(url, cols_a_conserver, type_zip, plusieurs_fichiers: bool):
         for name in z.namelist():
             if not name.endswith(".csv"):
                 continue
+            # on ne lit que l'en-tête pour savoir si le fichier a toutes les colonnes demandées
             with z.open(name) as f:
-                df_tmp = pd.read_csv(f, sep=";")
-            # On garde uniquement les fichiers qui ont bien toutes les colonnes demandées
-            if not set(cols_a_conserver).issubset(df_tmp.columns):
+                entete = pd.read_csv(f, sep=";", nrows=0).columns
+            if not set(cols_a_conserver).issubset(entete):
                 # fichier de métadonnées ou autre structure → on ignore
                 continue
+            # puis on ne lit que les colonnes utiles, en filtrant les lignes au fil de la lecture
+            with z.open(name) as f:
+                df_tmp = lire_csv(f, cols_a_conserver, dtype, chunksize, filtre_lignes)
             frames.append(df_tmp[cols_a_conserver])
 
         if not frames:
@@ -46,7 +133,7 @@ def url_to_df(url, cols_a_conserver, type_zip, plusieurs_fichiers: bool):
                 f"{cols_a_conserver}"
             )
 
-        df = pd.concat(frames, ignore_index=True)
+        df = concat_categories(frames)
         return df
 
     else:
@@ -0,0 +1,70 @@
+# schéma commun des bases du projet
+# - DEP : code département sur deux caractères ("01", ..., "2A", "2B", ..., "95"), en catégoriel
+#   quel que soit le format d'origine (1, "1", "01", 1.0)
+# - AAAA / MM : petits entiers (int16 / int8)
+# - mesures climatiques : float32
+# ingestion, indicateurs, cartes et économétrie s'appuient sur ces fonctions plutôt que
+# de refaire chacun leurs conversions de chaînes de caractères
+
+import numpy as np
+import pandas as pd
+
+
+# départements métropolitains (la Corse en 2A / 2B) puis DOM, dans l'ordre alphabétique des codes
+DEPS_METROPOLE = sorted([f"{i:02}" for i in range(1, 96) if i != 20] + ["2A", "2B"])
+DEPS_DOM = ["971", "972", "973", "974", "976"]
+DEP_DTYPE = pd.CategoricalDtype(DEPS_METROPOLE + DEPS_DOM)
+
+# la Corse est codée 20 dans les fichiers Météo-France
+ALIAS_DEP = {"20": ["2A", "2B"]}
+
+# départements d'Île-de-France
+DEPS_IDF = ["75", "77", "78", "91", "92", "93", "94", "95"]
+
+MESURES_CLIMAT = ["TM", "TX", "NBJTX0", "NBJTX25", "NBJTX30", "NBJTX35", "NBJNEIG"]
+
+SAISON_DTYPE = pd.CategoricalDtype(["hiver", "été", "Other"])
+PERIODE_DTYPE = pd.CategoricalDtype(["avant_2015", "apres_2015", "Other"])
+
+TYPES = {"AAAA": "int16", "MM": "int8", "saison": SAISON_DTYPE, "periode": PERIODE_DTYPE} \
+    | {c: "float32" for c in MESURES_CLIMAT}
+TYPES_CATEGORIELS = ["TOUR_RESID", "DEP_NOM"]
+
+
+# code département d'une valeur isolée : 1, "1", 1.0 -> "01" ; "2a" -> "2A"
+def code_dep(dep):
+    if isinstance(dep, (int, np.integer)) or (isinstance(dep, (float, np.floating)) and float(dep).is_integer()):
+        return f"{int(dep):02}"
+    return str(dep).strip().upper().zfill(2)
+
+
+# même chose pour une colonne : on ne convertit que les modalités distinctes
+def normalise_dep(serie):
+    if serie.dtype == DEP_DTYPE:
+        return serie
+    codes = pd.Series(pd.unique(serie.dropna()))
+    correspondance = dict(zip(codes, codes.map(code_dep)))
+    inconnus = set(correspondance.values()) - set(DEP_DTYPE.categories)
+    if inconnus:
+        raise ValueError(f"codes département inconnus : {sorted(inconnus)} "
+                         "(la Corse codée 20 est d'abord dédoublée en 2A et 2B, voir codes_dep)")
+    return serie.map(correspondance).astype(DEP_DTYPE)
+
+
+def codes_dep(dep):
+    dep = code_dep(dep)
+    return ALIAS_DEP.get(dep, [dep])
+
+
+# applique le schéma aux colonnes présentes de df
+def appliquer(df):
+    df = df.copy()
+    if "DEP" in df.columns:
+        df["DEP"] = normalise_dep(df["DEP"])
+    for col, type_col in TYPES.items():
+        if col in df.columns:
+            df[col] = df[col].astype(type_col)
+    for col in TYPES_CATEGORIELS:
+        if col in df.columns:
+            df[col] = df[col].astype("category")
+    return df
@@ -0,0 +1,83 @@
+# stockage en colonnes (Parquet) des bases du dossier Data/
+# chaque base est un dossier partitionné par département : Data/<nom>/DEP=01/part-0.parquet, ...
+# - les types sont fixés à l'écriture (schéma commun, voir schema.py)
+#   les lecteurs n'ont donc plus à refaire astype(str).str.zfill(2) sur DEP
+# - à la lecture, on ne charge que les colonnes et les départements demandés
+
+import os
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from . import schema
+
+
+# dossier racine du projet = 4 niveaux au-dessus de ce fichier
+DOSSIER_DONNEES = Path(os.environ.get(
+    "PROJET_DONNEES",
+    Path(__file__).resolve().parents[3] / "Data"))
+
+# DEP est lu comme du texte dans le nom des partitions ("01" et non 1)
+PARTITIONS = ds.partitioning(pa.schema([("DEP", pa.string())]), flavor="hive")
+
+
+def typer(df):
+    return(schema.appliquer(df))
+
+
+def chemin(nom, dossier=None):
+    return Path(dossier if dossier is not None else DOSSIER_DONNEES) / nom
+
+
+def existe(nom, dossier=None):
+    return chemin(nom, dossier).is_dir()
+
+
+def existe_partition(nom, DEP, dossier=None):
+    return (chemin(nom, dossier) / f"DEP={DEP}").is_dir()
+
+
+# écrit df dans la base `nom` ; seules les partitions des départements présents dans df
+# sont remplacées, les autres départements déjà écrits sont conservés
+def ecrire(df, nom, dossier=None):
+    if df.empty:
+        return
+    df = typer(df)
+    df["DEP"] = df["DEP"].astype(str)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    pq.write_to_dataset(table, chemin(nom, dossier),
+                        partitioning=PARTITIONS,
+                        existing_data_behavior="delete_matching",
+                        basename_template="part-{i}.parquet")
+
+
+def lire(nom, colonnes=None, deps=None, dossier=None):
+    """Lit la base `nom` en ne chargeant que `colonnes` et les départements `deps`."""
+    dataset = ds.dataset(chemin(nom, dossier), format="parquet", partitioning=PARTITIONS)
+    filtre = None
+    if deps is not None:
+        deps = [schema.code_dep(d) for d in deps]
+        filtre = ds.field("DEP").isin(deps)
+    if colonnes is not None and "DEP" not in colonnes:
+        colonnes = list(colonnes) + ["DEP"]
+    df = dataset.to_table(columns=colonnes, filter=filtre).to_pandas()
+    # DEP (nom de partition) revient en dernier : on remet l'ordre des colonnes d'origine
+    if colonnes is None and dataset.schema.pandas_metadata:
+        df = df[[c["name"] for c in dataset.schema.pandas_metadata["columns"] if c["name"] in df.columns]]
+    return(typer(df))
+
+
+# base au format Parquet si elle existe, sinon le fichier csv Data/<nom>.csv (en normalisant DEP)
+# un chemin_csv donné par l'appelant est toujours lu, même si la base Parquet existe
+def charger(nom, chemin_csv=None, colonnes=None, deps=None, dossier=None):
+    if chemin_csv is None and existe(nom, dossier):
+        return(lire(nom, colonnes, deps, dossier))
+    df = pd.read_csv(chemin_csv if chemin_csv is not None else chemin(nom + ".csv", dossier),
+                     usecols=colonnes if colonnes is None or "DEP" in colonnes else list(colonnes) + ["DEP"])
+    df = typer(df)
+    if deps is not None:
+        df = df.loc[df["DEP"].isin([schema.code_dep(d) for d in deps])]
+    return(df)
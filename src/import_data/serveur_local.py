@@ -0,0 +1,393 @@
+# serveur HTTP local qui remplace object.files.data.gouv.fr (fichiers MENSQ_XX et Q_XX de Météo-France)
+# et data.gouv.fr (archive INSEE) : l'import peut ainsi être lancé et chronométré hors ligne,
+# dans des conditions reproductibles
+# - les fichiers servis sont ceux d'un dossier de fichiers enregistrés (voir enregistrer) s'ils
+#   y sont, sinon des fichiers synthétiques de même structure, toujours identiques pour un même
+#   département
+# - latence (attente avant la réponse) et débit (octets par seconde et par connexion) réglables
+# - en-têtes ETag / Last-Modified et réponses 304, comme les vrais serveurs (cache_http)
+#
+# depuis la racine du projet :
+#   python -m src.import_data.serveur_local --port 8765 --latence 0.05 --debit 5e6
+# puis, dans un autre terminal, avec les variables d'environnement affichées :
+#   PROJET_URL_MENS=... PROJET_URL_INSEE=... PROJET_CACHE_HTTP=/tmp/cache python -m src.import_data.construction
+# ou depuis python :
+#   with serveur_local.Serveur(latence=0.05) as serveur, serveur.pointer():
+#       construction.construire("/tmp/Data")
+
+import gzip
+import hashlib
+import io
+import re
+import tempfile
+import threading
+import time
+import zipfile
+from contextlib import contextmanager
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+try:
+    from . import api_donnees_climat as climat
+    from . import api_donnees_climat_quot as quot
+    from . import api_donnees_tourisme as tourisme
+    from .fonctions import cache_http, recup_url, schema
+except ImportError:
+    import api_donnees_climat as climat
+    import api_donnees_climat_quot as quot
+    import api_donnees_tourisme as tourisme
+    from fonctions import cache_http, recup_url, schema
+
+
+CHEMIN_MENS = "/meteofrance/data/synchro_ftp/BASE/MENS/"
+CHEMIN_QUOT = "/meteofrance/data/synchro_ftp/BASE/QUOT/"
+CHEMIN_INSEE = "/api/1/datasets/r/1129fd80-2564-452c-86d4-9e36e7cca4a5"
+
+MOTIF_MENS = re.compile(r"MENSQ_(\w+)_previous-1950-2023\.csv\.gz$")
+MOTIF_QUOT = re.compile(r"Q_(\w+)_previous-1950-2023_RR-T-Vent\.csv\.gz$")
+
+
+# nom d'un fichier enregistré : dernier élément de l'url
+def nom_fichier(url):
+    return(url.rstrip("/").split("/")[-1])
+
+
+# ----------------------------------------------------------------------
+# fichiers synthétiques
+# ----------------------------------------------------------------------
+
+# fichier mensuel d'un département : `nb_stations` stations, chaque mois de 1950 à 2023,
+# températures saisonnières plausibles et quelques valeurs manquantes
+def mens_synthetique(DEP, nb_stations=30):
+    rng = np.random.default_rng(int(hashlib.sha256(DEP.encode()).hexdigest()[:8], 16))
+    annees = np.arange(1950, 2024)
+    mois = np.tile(np.arange(1, 13), len(annees))
+    aaaamm = np.repeat(annees, 12) * 100 + mois
+    n = len(aaaamm)
+
+    morceaux = []
+    for station in range(nb_stations):
+        alti = rng.uniform(0, 1500)
+        normale = 12 - alti / 150 + 8 * -np.cos((mois - 1) / 12 * 2 * np.pi) \
+            + (np.repeat(annees, 12) - 1950) * 0.02
+        tm = np.round(normale + rng.normal(0, 1.5, n), 1)
+        tx = np.round(tm + rng.uniform(4, 8, n), 1)
+        df = pd.DataFrame({
+            "NUM_POSTE": f"{DEP}{station:06}",
+            "NOM_USUEL": f"STATION {DEP}-{station}",
+            "LAT": round(rng.uniform(42, 51), 6),
+            "LON": round(rng.uniform(-4, 8), 6),
+            "ALTI": round(alti),
+            "AAAAMM": aaaamm,
+            "RR": np.round(rng.gamma(2, 35, n), 1),
+            "TN": np.round(2 * tm - tx, 1),
+            "TX": tx,
+            "TM": tm,
+            "NBJTX0": np.clip(np.round(-tx + 3 + rng.normal(0, 1, n)), 0, 31),
+            "NBJTX25": np.clip(np.round((tx - 20) * 3 + rng.normal(0, 2, n)), 0, 31),
+            "NBJTX30": np.clip(np.round((tx - 25) * 2 + rng.normal(0, 1, n)), 0, 31),
+            "NBJTX35": np.clip(np.round(tx - 30 + rng.normal(0, 1, n)), 0, 31),
+            "NBJNEIG": np.clip(np.round(-tm + 2 + rng.normal(0, 1, n)), 0, 31),
+        })
+        # stations ouvertes plus ou moins tard, mesures parfois absentes
+        df = df.loc[df["AAAAMM"] >= rng.choice(annees[:60]) * 100]
+        for col in ["TX", "TM", "NBJTX25", "NBJNEIG"]:
+            df.loc[rng.random(len(df)) < 0.03, col] = np.nan
+        morceaux.append(df)
+
+    tampon = io.BytesIO()
+    with gzip.GzipFile(fileobj=tampon, mode="wb", mtime=0) as f:
+        pd.concat(morceaux).to_csv(f, sep=";", index=False)
+    return(tampon.getvalue())
+
+
+# fichier quotidien d'un département : mêmes stations que mens_synthetique, un relevé par jour
+# (de 2000 à 2023 seulement, pour garder des fichiers de taille raisonnable), avec des épisodes
+# de chaleur l'été, des jours manquants et des stations ouvertes en cours de période
+def quot_synthetique(DEP, nb_stations=30):
+    rng = np.random.default_rng(int(hashlib.sha256(("Q" + DEP).encode()).hexdigest()[:8], 16))
+    dates = pd.date_range("2000-01-01", "2023-12-31", freq="D")
+    n = len(dates)
+    jour_an = dates.dayofyear.to_numpy()
+    aaaammjj = (dates.year * 10000 + dates.month * 100 + dates.day).to_numpy()
+
+    morceaux = []
+    for station in range(nb_stations):
+        alti = rng.uniform(0, 1500)
+        normale = 15 - alti / 200 + 9 * -np.cos((jour_an - 15) / 365 * 2 * np.pi)
+        # anomalies persistantes d'un jour à l'autre : des épisodes chauds de quelques jours
+        anomalie = pd.Series(rng.normal(0, 3, n)).ewm(alpha=0.4).mean().to_numpy() * 2
+        tm = normale + anomalie
+        amplitude = rng.uniform(6, 12, n)
+        df = pd.DataFrame({
+            "NUM_POSTE": f"{DEP}{station:06}",
+            "NOM_USUEL": f"STATION {DEP}-{station}",
+            "LAT": round(rng.uniform(42, 51), 6),
+            "LON": round(rng.uniform(-4, 8), 6),
+            "ALTI": round(alti),
+            "AAAAMMJJ": aaaammjj,
+            "RR": np.round(rng.gamma(0.5, 5, n), 1),
+            "QRR": 1,
+            "TN": np.round(tm - amplitude / 2, 1),
+            "QTN": 1,
+            "TX": np.round(tm + amplitude / 2, 1),
+            "QTX": 1,
+        })
+        df = df.loc[df["AAAAMMJJ"] >= rng.choice(np.arange(2000, 2016)) * 10000]
+        df.loc[rng.random(len(df)) < 0.02, "TX"] = np.nan
+        df = df.loc[rng.random(len(df)) >= 0.01]
+        morceaux.append(df)
+
+    tampon = io.BytesIO()
+    with gzip.GzipFile(fileobj=tampon, mode="wb", mtime=0) as f:
+        pd.concat(morceaux).to_csv(f, sep=";", index=False)
+    return(tampon.getvalue())
+
+
+# archive INSEE : arrivées et nuitées mensuelles et annuelles par département et par région,
+# par type d'hébergement et origine des touristes, plus un fichier de métadonnées
+def insee_synthetique():
+    rng = np.random.default_rng(0)
+    geos = [("DEP", d) for d in schema.DEP_DTYPE.categories] \
+        + [("REG", str(r)) for r in [11, 24, 27, 28, 32, 44, 52, 53, 75, 76, 84, 93, 94]]
+    periodes = [("M", f"{a}-{m:02}") for a in range(2010, 2025) for m in range(1, 13)] \
+        + [("A", f"{a}") for a in range(2010, 2025)]
+
+    index = pd.MultiIndex.from_product(
+        [["I551", "I552", "I553"], range(len(geos)), ["ARR", "NUI"], ["250", "1_X_250"], range(len(periodes))],
+        names=["ACTIVITY", "geo", "TOUR_MEASURE", "TOUR_RESID", "periode"]).to_frame(index=False)
+    valeur = np.round(rng.lognormal(4, 0.8, len(index)), 3)
+    index["OBS_VALUE"] = np.where(index["TOUR_MEASURE"] == "NUI", valeur * 2.5, valeur)
+
+    # total (_T) = résidents + non-résidents
+    total = index.groupby(["ACTIVITY", "geo", "TOUR_MEASURE", "periode"], as_index=False)["OBS_VALUE"].sum()
+    df = pd.concat([index, total.assign(TOUR_RESID="_T")], ignore_index=True)
+    df["FREQ"] = [periodes[p][0] for p in df["periode"]]
+    df["TIME_PERIOD"] = [periodes[p][1] for p in df["periode"]]
+    df["GEO_OBJECT"] = [geos[g][0] for g in df["geo"]]
+    df["GEO"] = [geos[g][1] for g in df["geo"]]
+    df = df.assign(TERRTYPO="_T", UNIT_LOC_RANKING="_T", CONF_STATUS="F", DECIMALS=1,
+                   OBS_STATUS="A", OBS_STATUS_FR="DEF", UNIT_MULT=3)
+    df["OBS_VALUE"] = np.round(df["OBS_VALUE"], 3)
+    df = df[tourisme.cols]
+
+    metadonnees = pd.DataFrame({"COD_VAR": ["ACTIVITY", "TOUR_RESID"],
+                                "LIB_VAR": ["Type d'hébergement", "Résidence du touriste"]})
+    tampon = io.BytesIO()
+    with zipfile.ZipFile(tampon, "w", zipfile.ZIP_DEFLATED) as z:
+        # date fixe : sans elle, writestr inscrit l'heure courante et l'archive (donc son ETag)
+        # changerait à chaque démarrage du serveur
+        for nom, table in [("DS_TOUR_FREQ_data.csv", df), ("DS_TOUR_FREQ_metadata.csv", metadonnees)]:
+            z.writestr(zipfile.ZipInfo(nom, date_time=(1980, 1, 1, 0, 0, 0)), table.to_csv(sep=";", index=False),
+                       compress_type=zipfile.ZIP_DEFLATED)
+    return(tampon.getvalue())
+
+
+# ----------------------------------------------------------------------
+# enregistrement des vrais fichiers
+# ----------------------------------------------------------------------
+
+# télécharge les vrais fichiers dans `dossier` pour les resservir ensuite hors ligne
+def enregistrer(dossier, deps=None, insee=True):
+    dossier = Path(dossier)
+    dossier.mkdir(parents=True, exist_ok=True)
+    urls = [climat.url_dpt(DEP) for DEP in (deps or climat.LISTE_DEP)]
+    if insee:
+        urls.append(tourisme.URL_INSEE)
+    session = recup_url.creer_session()
+    with session:
+        for url in urls:
+            (dossier / nom_fichier(url)).write_bytes(recup_url.telecharger(url, session))
+    return(urls)
+
+
+# ----------------------------------------------------------------------
+# serveur
+# ----------------------------------------------------------------------
+
+class _Gestionnaire(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self._repondre(corps=True)
+
+    def do_HEAD(self):
+        self._repondre(corps=False)
+
+    def _repondre(self, corps):
+        serveur = self.server.local
+        # les requêtes sont traitées dans plusieurs threads
+        with serveur._verrou_compteur:
+            serveur.nb_requetes += 1
+        if serveur.latence:
+            time.sleep(serveur.latence)
+
+        contenu = serveur.contenu(self.path.split("?")[0])
+        if contenu is None:
+            self.send_error(404)
+            return
+        etag = '"' + hashlib.sha256(contenu).hexdigest()[:32] + '"'
+
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(len(contenu)))
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", serveur.date_modification)
+        self.end_headers()
+        if corps:
+            self._envoyer(contenu, serveur.debit)
+
+    # envoi par morceaux, en attendant entre deux morceaux pour ne pas dépasser `debit`
+    def _envoyer(self, contenu, debit):
+        taille_morceau = 64 * 1024
+        debut = time.perf_counter()
+        for i in range(0, len(contenu), taille_morceau):
+            self.wfile.write(contenu[i:i + taille_morceau])
+            if debit:
+                attente = (i + taille_morceau) / debit - (time.perf_counter() - debut)
+                if attente > 0:
+                    time.sleep(attente)
+
+    def log_message(self, format, *args):
+        if self.server.local.verbeux:
+            super().log_message(format, *args)
+
+
+class Serveur:
+    """Serveur local des fichiers Météo-France et INSEE, lancé dans un thread.
+
+    latence : secondes d'attente avant chaque réponse
+    debit : octets par seconde et par connexion (None = sans limite)
+    dossier_fichiers : fichiers enregistrés, servis à la place des fichiers synthétiques
+    nb_stations : nombre de stations des fichiers départementaux synthétiques"""
+
+    def __init__(self, port=0, latence=0.0, debit=None, dossier_fichiers=None,
+                 nb_stations=30, verbeux=False):
+        self.latence = latence
+        self.debit = debit
+        self.dossier_fichiers = Path(dossier_fichiers) if dossier_fichiers is not None else None
+        self.nb_stations = nb_stations
+        self.verbeux = verbeux
+        self.nb_requetes = 0
+        self.date_modification = formatdate(usegmt=True)
+        self._contenus = {}
+        self._verrou = threading.Lock()
+        self._verrou_compteur = threading.Lock()
+        self._http = ThreadingHTTPServer(("127.0.0.1", port), _Gestionnaire)
+        self._http.daemon_threads = True
+        self._http.local = self
+        self._thread = None
+
+    @property
+    def adresse(self):
+        return(f"http://127.0.0.1:{self._http.server_address[1]}")
+
+    @property
+    def url_mens(self):
+        return(self.adresse + CHEMIN_MENS)
+
+    @property
+    def url_insee(self):
+        return(self.adresse + CHEMIN_INSEE)
+
+    @property
+    def url_quot(self):
+        return(self.adresse + CHEMIN_QUOT)
+
+    # contenu servi pour `chemin` (fichier enregistré ou synthétique, calculé une seule fois)
+    def contenu(self, chemin):
+        with self._verrou:
+            if chemin not in self._contenus:
+                self._contenus[chemin] = self._produire(chemin)
+            return(self._contenus[chemin])
+
+    def _produire(self, chemin):
+        if self.dossier_fichiers is not None:
+            fichier = self.dossier_fichiers / nom_fichier(chemin)
+            if fichier.is_file():
+                return(fichier.read_bytes())
+        if chemin == CHEMIN_INSEE:
+            return(insee_synthetique())
+        trouve = MOTIF_MENS.search(chemin)
+        if chemin.startswith(CHEMIN_MENS) and trouve:
+            return(mens_synthetique(trouve.group(1), self.nb_stations))
+        trouve = MOTIF_QUOT.search(chemin)
+        if chemin.startswith(CHEMIN_QUOT) and trouve:
+            return(quot_synthetique(trouve.group(1), self.nb_stations))
+        return(None)
+
+    # remplace le contenu servi pour un fichier (pour simuler une mise à jour de la source)
+    def remplacer(self, chemin, contenu):
+        with self._verrou:
+            self._contenus[chemin] = contenu
+
+    def demarrer(self):
+        self._thread = threading.Thread(target=self._http.serve_forever, daemon=True)
+        self._thread.start()
+        return(self)
+
+    def arreter(self):
+        self._http.shutdown()
+        self._http.server_close()
+
+    def __enter__(self):
+        return(self.demarrer())
+
+    def __exit__(self, *exc):
+        self.arreter()
+
+    # le temps du bloc with, l'import lit ses fichiers sur ce serveur et les range dans un cache
+    # de téléchargements à part (dossier_cache, par défaut un dossier temporaire supprimé à la
+    # sortie) : le cache du projet (.cache/telechargements) n'est pas touché
+    @contextmanager
+    def pointer(self, dossier_cache=None):
+        temporaire = tempfile.TemporaryDirectory() if dossier_cache is None else None
+        cache = cache_http.CacheTelechargements(temporaire.name if temporaire else dossier_cache)
+        anciennes = climat.URL_MENS, quot.URL_QUOT, tourisme.URL_INSEE
+        climat.URL_MENS, quot.URL_QUOT, tourisme.URL_INSEE = self.url_mens, self.url_quot, self.url_insee
+        ancien_cache = cache_http.changer_cache_defaut(cache)
+        try:
+            yield self
+        finally:
+            climat.URL_MENS, quot.URL_QUOT, tourisme.URL_INSEE = anciennes
+            cache_http.changer_cache_defaut(ancien_cache)
+            if temporaire is not None:
+                temporaire.cleanup()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serveur local des fichiers Météo-France et INSEE")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latence", type=float, default=0.0, help="secondes d'attente avant chaque réponse")
+    parser.add_argument("--debit", type=float, default=None, help="octets par seconde et par connexion")
+    parser.add_argument("--fichiers", default=None, help="dossier de fichiers enregistrés")
+    parser.add_argument("--stations", type=int, default=30, help="stations par fichier département synthétique")
+    parser.add_argument("--enregistrer", action="store_true",
+                        help="télécharge les vrais fichiers dans --fichiers puis s'arrête")
+    args = parser.parse_args()
+
+    if args.enregistrer:
+        if args.fichiers is None:
+            parser.error("--enregistrer demande un dossier --fichiers")
+        print(len(enregistrer(args.fichiers)), "fichier(s) enregistré(s) dans", args.fichiers)
+    else:
+        serveur = Serveur(args.port, args.latence, args.debit, args.fichiers, args.stations, verbeux=True)
+        print(f"PROJET_URL_MENS={serveur.url_mens}")
+        print(f"PROJET_URL_QUOT={serveur.url_quot}")
+        print(f"PROJET_URL_INSEE={serveur.url_insee}")
+        try:
+            serveur._http.serve_forever()
+        except KeyboardInterrupt:
+            serveur.arreter()
@@ -5,22 +5,30 @@
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
 import matplotlib as mpl
-import pandas as pd
-import geopandas as gpd
-import time
-from IPython.display import HTML, display
-from IPython.display import Image
+from matplotlib.collections import PatchCollection
+from matplotlib.patches import PathPatch
+from matplotlib.path import Path
+import numpy as np
+import shapely
+import os
+from concurrent.futures import ProcessPoolExecutor
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from PIL import Image as ImagePIL
 from shapely.errors import TopologicalError
+from src.import_data.fonctions import stockage, schema
+from src.package_project import geometrie, cache_cartes
 
 
 
 ###############################################################################################################
 # Importation des donnnée
 ###############################################################################################################
-def Base_carte():
-    base = pd.read_csv("base.csv")
-    base = base.groupby(["DEP", "AAAA", "saison"])["TM"].mean().reset_index()
-    base["DEP"] = base["DEP"].astype(str).str.zfill(2)
+def Base_carte(path=None):
+    # seules les colonnes utiles sont lues ; DEP est déjà normalisé par le stockage
+    # path : fichier csv à lire à la place de la base Parquet Data/base
+    base = stockage.charger("base", chemin_csv=path, colonnes=["DEP", "AAAA", "saison", "TM"])
+    base = base.groupby(["DEP", "AAAA", "saison"], observed=True)["TM"].mean().reset_index()
+    base["DEP"] = base["DEP"].astype(str)
     return base
 
 
@@ -29,10 +37,8 @@ def Base_carte():
 # Chargement de la carte et verification
 ##############################################################################################################
 def carte():
-    url = "https://france-geojson.gregoiredavid.fr/repo/departements.geojson"
-    gdf = gpd.read_file(url).rename(columns={"code": "DEP"}).to_crs(epsg=3857)
-    gdf["DEP"] = gdf["DEP"].astype(str).str.zfill(2)
-    return gdf
+    # contours france-geojson déjà projetés en 3857, lus une fois par session (voir geometrie.py)
+    return geometrie.departements(crs=3857, source="gregoiredavid")
 
 
 def clean_geometry(g):
@@ -47,7 +53,6 @@ def verification():
     Description:
     """
     gdf = carte()
-    gdf1 = gdf
     gdf["geometry"] = gdf["geometry"].apply(clean_geometry)
     
     # détection des géométries invalides
@@ -56,7 +61,6 @@ def verification():
         print(f"{n_invalid} géométries invalides supprimées")
         
     gdf = gdf[gdf.geometry.notna() & gdf.geometry.is_valid]
-    gdf["DEP"] = gdf["DEP"].astype(str).str.zfill(2)
     return gdf
 
 
@@ -64,110 +68,168 @@ def verification():
 # creaction du gif
 #######################################################################################################################
 
-def gif(saison):
-    """
-    Description:
-    """
-
-    # definition du nom du gif
-    nom_fichier = f"cart_pour_les {saison}.gif"
-
-    # chargement des données et filtrage selon la saison
+# valeurs de TM de la saison, une ligne par année, rangées dans l'ordre des contours
+# contours au niveau de détail d'une image de `figsize` pouces à `dpi` (taille des images du gif)
+def donnees_gif(saison, figsize=(10, 10), dpi=100):
     base = Base_carte()
-    gdf = carte()
     base = base[base["saison"] == saison]
+    geo = geometrie.departements_indexes(crs=3857, source="gregoiredavid",
+                                         tolerance=geometrie.tolerance_pour(figsize, dpi))
+    annees = sorted(base["AAAA"].unique())
+    valeurs = np.vstack([geo.lier(base.loc[base["AAAA"] == anne, ["DEP", "TM"]], "TM") for anne in annees])
+    return geo, annees, valeurs
 
-    # Frames 
-    frames = (
-        base[["AAAA", "saison"]]
-        .drop_duplicates()
-        .sort_values("AAAA")
-        .itertuples(index=False, name=None))
-    frames = list(frames)
-
-    # Pré-merge
-    merged_frames = {}
-    for anne, moi in frames:
-        df = base.loc[
-            (base["AAAA"] == anne) & (base["saison"] == moi),
-            ["DEP", "TM"]]
-        
-        merged = gdf.merge(df, on="DEP", how="inner")
-        merged_frames[(anne, moi)] = merged if not merged.empty else None
-
-    # Figure
-    fig, ax = plt.subplots(figsize=(10, 10), facecolor="white", layout="constrained")
-    ax.axis("off")
-
-    # dimenssionnemt des cartes
-    minx, miny, maxx, maxy = gdf.total_bounds
-    ax.set_xlim(minx, maxx)
-    ax.set_ylim(miny, maxy)
-    ax.set_aspect("equal")
-
-    # Uniformisation des col bars
-    vmin, vmax = base["TM"].min(), base["TM"].max()
-    cmap = mpl.cm.get_cmap("coolwarm")
-    norm = mpl.colors.Normalize(vmin=vmin, vmax=vmax)
-    sm = mpl.cm.ScalarMappable(cmap=cmap, norm=norm)
-    sm._A = []
-    fig.colorbar(sm, ax=ax, fraction=0.046, pad=0.04).set_label("Température (°C)")
-
-    # Fonction update locale
-    def update(i):
-        anne, moi = frames[i]
-    
-        ax.clear()
-        ax.axis("off")
-        ax.set_xlim(minx, maxx)
-        ax.set_ylim(miny, maxy)
-        ax.set_aspect("equal")
-    
-        ax.set_title(f"Température — Année {anne}, Saison {moi}", fontsize=15)
-    
-        carte = merged_frames.get((anne, moi))
-        if carte is None:
-            return []
-    
-        carte.plot(
-            column="TM",
-            cmap=cmap,
-            norm=norm,
-            linewidth=0.6,
-            ax=ax,
-            edgecolor="0.6",
-            legend=False
-        )
-    
-        # Labels centrés
-        for _, row in carte.iterrows():
-            c = row.geometry.centroid
-            ax.text(
-                c.x, c.y,
-                str(row.get("nom", "")),
-                fontsize=7,
-                ha="center",
-                va="center",
-                color="black"
-            )
-    
-        return ax.collections + ax.texts
-
-
-
-    ani = animation.FuncAnimation(
-        fig,
-        update,
-        frames=len(frames),
-        interval=6000,
-        blit=False)
 
-    ani.save(nom_fichier, writer="pillow", fps=1)
-
-    plt.close(fig)  # évite l'affichage statique de la figure
+class RenduCarte:
+    """
+    Description:
+    Carte animée dessinée une seule fois : polygones (une seule collection), étiquettes
+    placées aux centroïdes calculés d'avance, titre et barre de couleurs.
+    frame(i) ne change ensuite que les couleurs des polygones, les étiquettes visibles et
+    le titre : le coût d'une image se réduit presque à son encodage.
+    Les départements sans valeur ne sont pas dessinés.
+    """
 
-    time.sleep(2)
-    Image(filename = nom_fichier)
+    def __init__(self, geo, valeurs, titres, cmap="coolwarm", vmin=None, vmax=None,
+                 label="Température (°C)", figsize=(10, 10), dpi=100):
+        self.valeurs = valeurs
+        self.titres = titres
+        self.cmap = mpl.colormaps[cmap] if isinstance(cmap, str) else cmap
+        self.norm = mpl.colors.Normalize(vmin=np.nanmin(valeurs) if vmin is None else vmin,
+                                         vmax=np.nanmax(valeurs) if vmax is None else vmax)
+
+        self.fig, self.ax = plt.subplots(figsize=figsize, dpi=dpi, facecolor="white", layout="constrained")
+        self.ax.axis("off")
+        # marge en haut pour le titre, placé dans le cadre de l'axe
+        minx, miny, maxx, maxy = geo.gdf.total_bounds
+        self.ax.set_xlim(minx, maxx)
+        self.ax.set_ylim(miny, maxy + 0.07 * (maxy - miny))
+        self.ax.set_aspect("equal")
+
+        # un chemin par polygone ; self.departement_de : département de chaque polygone
+        # (un département en plusieurs morceaux, comme les îles, a plusieurs polygones)
+        polygones, self.departement_de = shapely.get_parts(geo.geometries, return_index=True)
+        chemins = [Path.make_compound_path(*[Path(np.asarray(anneau.coords)[:, :2], closed=True)
+                                             for anneau in [p.exterior, *p.interiors]])
+                   for p in polygones]
+        self.polygones = PatchCollection([PathPatch(c) for c in chemins], linewidths=0.6)
+        self.ax.add_collection(self.polygones)
+
+        # étiquettes aux centroïdes, calculés une fois
+        centres = shapely.centroid(geo.geometries)
+        self.etiquettes = [
+            self.ax.text(c.x, c.y, str(nom), fontsize=7, ha="center", va="center", color="black")
+            for c, nom in zip(centres, geo.gdf["nom"])]
+
+        # titre dans le cadre de l'axe : il est redessiné avec le reste quand on utilise le blit
+        self.titre = self.ax.text(0.5, 1, "", transform=self.ax.transAxes, fontsize=15,
+                                  ha="center", va="top")
+
+        sm = mpl.cm.ScalarMappable(cmap=self.cmap, norm=self.norm)
+        self.fig.colorbar(sm, ax=self.ax, fraction=0.046, pad=0.04).set_label(label)
+
+        # mise en page calculée une fois puis figée : elle ne bouge plus d'une image à l'autre
+        # (les images ne dépendent pas de l'ordre dans lequel elles sont dessinées)
+        self.fig.draw_without_rendering()
+        self.fig.set_layout_engine("none")
+
+    def artistes(self):
+        return [self.polygones, self.titre, *self.etiquettes]
+
+    def frame(self, i):
+        valeurs = self.valeurs[i]
+        presents = ~np.isnan(valeurs)
+        faces = self.cmap(self.norm(valeurs))
+        faces[~presents] = 0
+        bords = np.where(presents[:, None], mpl.colors.to_rgba("0.6"), 0.0)
+        self.polygones.set_facecolor(faces[self.departement_de])
+        self.polygones.set_edgecolor(bords[self.departement_de])
+        for etiquette, present in zip(self.etiquettes, presents):
+            etiquette.set_visible(present)
+        self.titre.set_text(self.titres[i])
+        return self.artistes()
+
+    def animation(self, interval=6000, blit=False):
+        return animation.FuncAnimation(
+            self.fig,
+            self.frame,
+            frames=len(self.valeurs),
+            init_func=self.artistes,
+            interval=interval,
+            blit=blit)
+
+
+# ------------------------------------------------------------------
+# export : images dessinées en parallèle (moteur Agg), puis assemblées avec Pillow
+# ------------------------------------------------------------------
+
+# les processus n'affichent rien : moteur Agg, sans fenêtre
+def _initialiser_processus():
+    mpl.use("Agg")
+
+
+# images RGB des frames `indices` : la carte est dessinée une fois par appel (RenduCarte),
+# puis chaque frame ne change que les couleurs et le titre
+def rasteriser(geo, valeurs, titres, indices):
+    rendu = RenduCarte(geo, valeurs, titres)
+    canevas = FigureCanvasAgg(rendu.fig)
+    images = []
+    for i in indices:
+        rendu.frame(i)
+        canevas.draw()
+        images.append(np.asarray(canevas.buffer_rgba())[:, :, :3].copy())
+    plt.close(rendu.fig)
+    return images
+
+
+# gif à partir des images RGB : une seule palette de 256 couleurs, calculée une fois sur un
+# échantillon des pixels de toutes les images, puis appliquée à chacune (sans tramage)
+def assembler_gif(images, nom_fichier, fps=1):
+    echantillon = np.concatenate([image[::4, ::4] for image in images])
+    palette = ImagePIL.fromarray(echantillon).quantize(colors=256, method=ImagePIL.Quantize.MEDIANCUT)
+    frames = [ImagePIL.fromarray(image).quantize(palette=palette, dither=ImagePIL.Dither.NONE)
+              for image in images]
+    frames[0].save(nom_fichier, save_all=True, append_images=frames[1:],
+                   duration=int(1000 / fps), loop=0)
+    return nom_fichier
+
+
+def gifs(saisons=("hiver", "été"), processus=None):
+    """
+    Description:
+    Cartes animées de plusieurs saisons ("cart_pour_les <saison>.gif").
+    Les images de toutes les saisons sont réparties entre `processus` processus
+    (par défaut un par cœur) ; processus=1 dessine tout dans le processus courant.
+    Renvoie les noms des fichiers écrits.
+    """
+    processus = processus or os.cpu_count() or 1
+    travaux = {}
+    for saison in saisons:
+        geo, annees, valeurs = donnees_gif(saison)
+        titres = [f"Température — Année {anne}, Saison {saison}" for anne in annees]
+        paquets = np.array_split(np.arange(len(annees)), min(processus, len(annees)))
+        travaux[saison] = [(geo, valeurs, titres, list(paquet)) for paquet in paquets]
+
+    if processus == 1:
+        images = {saison: [rasteriser(*t) for t in liste] for saison, liste in travaux.items()}
+    else:
+        with ProcessPoolExecutor(processus, initializer=_initialiser_processus) as executor:
+            futurs = {saison: [executor.submit(rasteriser, *t) for t in liste]
+                      for saison, liste in travaux.items()}
+            images = {saison: [f.result() for f in liste] for saison, liste in futurs.items()}
+
+    return [assembler_gif([image for paquet in images[saison] for image in paquet],
+                          f"cart_pour_les {saison}.gif")
+            for saison in saisons]
+
+
+def gif(saison, processus=None):
+    """
+    Description:
+    Carte animée de la température moyenne de la saison, une image par année,
+    enregistrée dans "cart_pour_les <saison>.gif" (voir gifs)
+    """
+    return gifs([saison], processus)[0]
 
 
     
@@ -213,6 +275,13 @@ def carte_departements(
     Affiche une carte choroplèthe
     """
 
+    figure_departements(dataset, figsize, cmap, legend)
+    plt.show()
+
+
+# figure de carte_departements (sans l'afficher), contours au niveau de détail de
+# `figsize` à `dpi` (par défaut la résolution des figures matplotlib)
+def figure_departements(dataset, figsize=(10, 10), cmap="Set2", legend=True, dpi=None):
     # =====================================================
     # 1. Copie défensive
     # =====================================================
@@ -221,30 +290,18 @@ def carte_departements(
     # =====================================================
     # 2. Normalisation des codes département
     # =====================================================
-    data["departement"] = (
-    pd.to_numeric(data["departement"], errors="coerce")
-    .dropna()
-    .astype(int)
-    .astype(str)
-    .str.zfill(2)
-    )
+    data["departement"] = schema.normalise_dep(data["departement"]).astype(str)
 
 
     # =====================================================
     # 3. Chargement du shapefile
     # =====================================================
-    url = "https://france-geojson.gregoiredavid.fr/repo/departements.geojson"
-    gdf = gpd.read_file(url).rename(columns={"code": "departement"}).to_crs(epsg=3857)
-    gdf["departement"] = gdf["departement"].astype(str).str.zfill(2)
-    geo_data = gdf
+    geo = geometrie.departements_indexes(crs=3857, source="gregoiredavid",
+                                         tolerance=geometrie.tolerance_pour(figsize, dpi))
     # =====================================================
-    # 4. Jointure spatiale
+    # 4. Jointure (par position dans les contours indexés)
     # =====================================================
-    geo_data = geo_data.merge(
-        data,
-        on = "departement",
-        how="inner"
-    )
+    geo_data = geo.joindre(data, dep="departement")
     #print(geo_data.info())
     # =====================================================
     # 5. Carte
@@ -270,8 +327,23 @@ def carte_departements(
         fontsize=14
     )
     ax.axis("off")
+    return fig
 
-    plt.show()
+
+def image_departements(dataset, figsize=(10, 10), cmap="Set2", legend=True,
+                       format="png", dpi=100, dossier=None):
+    """
+    Description:
+    Même carte que carte_departements, rendue sous forme d'image enregistrée
+    (Data/cartes, voir cache_cartes.py) : elle n'est redessinée que si les codes des
+    départements, la palette, la taille ou les contours ont changé. Renvoie son chemin.
+    """
+    tolerance = geometrie.tolerance_pour(figsize, dpi)
+    cle = cache_cartes.cle("departements", cache_cartes.empreinte_valeurs(dataset, "code", dep="departement"),
+                           cmap, legend, figsize,
+                           geometrie.version(crs=3857, source="gregoiredavid", tolerance=tolerance))
+    return cache_cartes.image(cle, lambda: figure_departements(dataset, figsize, cmap, legend, dpi),
+                              format, dpi, dossier)
 
 
 
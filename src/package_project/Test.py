@@ -20,6 +20,7 @@ from statsmodels.tsa.api import UECM
 from xgboost import XGBRegressor
 from sklearn.model_selection import GridSearchCV, TimeSeriesSplit
 from sklearn.metrics import mean_squared_error, mean_absolute_error, r2_score
+from src.import_data.fonctions import stockage, schema
 
 
 # lien pour une ressource presentant les ARDL
@@ -30,7 +31,7 @@ warnings.filterwarnings("ignore")
 #######################################################################################################################
 # Fonction pour les données
 ######################################################################################################################
-def Donne(dep, path="base.csv", verbose=True):
+def Donne(dep, path=None, verbose=True):
     """
     OBJECTIF
     --------
@@ -51,7 +52,8 @@ def Donne(dep, path="base.csv", verbose=True):
     dep : int ou str
         Numéro du département
     path : str
-        Chemin vers le fichier CSV
+        Chemin vers un fichier CSV ; par défaut la base Parquet Data/base
+        (ou Data/base.csv si elle n'existe pas)
     verbose : bool
         Affichage des informations descriptives
 
@@ -66,10 +68,14 @@ def Donne(dep, path="base.csv", verbose=True):
     # =====================================================
     # 0. Chargement et filtrage
     # =====================================================
-    base = pd.read_csv(path)
+    # on ne charge que le département et les colonnes utiles
+    dep = schema.code_dep(dep)
+    base = stockage.charger(
+        "base",
+        chemin_csv=path,
+        colonnes=["DEP", "AAAA", "MM", "TM", "OBS_VALUE_CORR", "NBJTX30", "NBJNEIG"],
+        deps=[dep])
 
-    dep = str(dep)
-    dep = dep.zfill(2)
     data = base.loc[
         base["DEP"] == dep,
         ["AAAA", "MM", "TM", "OBS_VALUE_CORR", "NBJTX30", "NBJNEIG"]
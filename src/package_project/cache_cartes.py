@@ -0,0 +1,87 @@
+# images des cartes déjà dessinées, retrouvées par l'empreinte de ce qu'elles représentent
+# les mêmes cartes (corrélations par département, cartes du rapport...) étaient redessinées à
+# chaque exécution du rapport alors que leurs données n'avaient pas changé. Chaque image est
+# maintenant enregistrée dans Data/cartes/<clé>-<dpi>.<format>, la clé étant l'empreinte
+# - des valeurs liées aux départements (une valeur par code DEP au format commun)
+# - de la palette et de l'échelle (vmin, centre, vmax), des titres et de la taille de la figure
+# - de la version des contours (geometrie.version) et de VERSION_RENDU
+# si l'image existe, on rend son chemin sans appeler matplotlib ni geopandas
+
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+from src.import_data.fonctions import schema, stockage
+from src.package_project import memo
+
+# à augmenter quand le dessin des cartes change : les images déjà enregistrées sont ignorées
+VERSION_RENDU = 2
+
+compteurs = {"succes": 0, "echecs": 0}
+
+
+def dossier_images(dossier=None):
+    return(stockage.chemin("cartes", dossier))
+
+
+# empreinte de valeurs par département : l'ordre des lignes et l'écriture des codes
+# (1, "1", "01") ne changent pas la clé
+def empreinte_valeurs(data, colonne, dep="DEP"):
+    valeurs = pd.DataFrame({"DEP": schema.normalise_dep(data[dep]).astype(str),
+                            "valeur": data[colonne].to_numpy()})
+    valeurs = valeurs.sort_values(["DEP", "valeur"], kind="stable").reset_index(drop=True)
+    return(memo.empreinte_df(valeurs))
+
+
+def cle(*parties):
+    parties = tuple(p.item() if isinstance(p, np.generic) else p for p in parties)
+    return(hashlib.sha256(repr((VERSION_RENDU, memo.normalise(None, parties))).encode()).hexdigest()[:32])
+
+
+def images(cle_image, dessiner, formats=("png",), dpi=100, dossier=None):
+    """Chemins des images `cle_image` dans chacun des formats (png, svg...).
+
+    dessiner() n'est appelé que s'il manque un format : il rend une figure matplotlib,
+    enregistrée dans tous les formats manquants puis fermée."""
+    # la résolution fait partie du nom : la même carte peut être gardée en plusieurs tailles
+    cle_image = f"{cle_image}-{dpi}"
+    chemins = {f: dossier_images(dossier) / f"{cle_image}.{f}" for f in formats}
+    manquants = [f for f, c in chemins.items() if not c.exists()]
+    compteurs["echecs" if manquants else "succes"] += 1
+    if manquants:
+        import matplotlib.pyplot as plt
+
+        dossier_images(dossier).mkdir(parents=True, exist_ok=True)
+        fig = dessiner()
+        for f in manquants:
+            # écriture dans un fichier temporaire puis renommage : deux processus peuvent
+            # dessiner la même carte sans qu'un lecteur voie un fichier à moitié écrit
+            temporaire = chemins[f].with_name(f"{cle_image}.{os.getpid()}.{f}.tmp")
+            fig.savefig(temporaire, format=f, dpi=dpi, bbox_inches="tight")
+            os.replace(temporaire, chemins[f])
+        plt.close(fig)
+    return(chemins)
+
+
+def image(cle_image, dessiner, format="png", dpi=100, dossier=None):
+    return(images(cle_image, dessiner, [format], dpi, dossier)[format])
+
+
+# affichage dans le notebook
+def afficher(chemin):
+    from IPython.display import SVG, Image
+
+    return(SVG(filename=chemin) if str(chemin).endswith(".svg") else Image(filename=chemin))
+
+
+def infos_cache(dossier=None):
+    fichiers = list(dossier_images(dossier).glob("*.*")) if dossier_images(dossier).exists() else []
+    return({**compteurs, "fichiers": len(fichiers), "octets": sum(f.stat().st_size for f in fichiers)})
+
+
+def vider_cache(dossier=None):
+    if dossier_images(dossier).exists():
+        for fichier in dossier_images(dossier).glob("*.*"):
+            fichier.unlink()
+    compteurs.update(succes=0, echecs=0)
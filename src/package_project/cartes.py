@@ -1,6 +1,12 @@
-from src.package_project import indicateurs_climat
-import geopandas as gpd
-from cartiflette import carti_download
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from src.package_project import indicateurs_climat, indicateurs_tourisme, geometrie, cache_cartes
+from src.package_project.cube import Cube
+from src.import_data.fonctions import schema, stockage
 import matplotlib.pyplot as plt
 import matplotlib as mcolors
 from matplotlib.colors import TwoSlopeNorm, LinearSegmentedColormap
@@ -15,62 +21,50 @@ col_palette_mixte = [
 # Create a ListedColormap
 custom_cmap_mixte = LinearSegmentedColormap.from_list("custom_gradient", col_palette_mixte)
 
-# fonctions
-def hex_to_rgb_norm(hex_color):
-    hex_color = hex_color.lstrip("#")
-    return tuple(int(hex_color[i:i+2], 16) / 255 for i in (0, 2, 4))
-
-def remove_leading_zeros(num):
-    return num.lstrip('0')
-
-def donnee_carte(data):
-# Charger les départements français depuis une source publique
-    france = carti_download(
-        values = ["France"],
-        crs = 4326,
-        borders = "DEPARTEMENT",
-        vectorfile_format="geojson",
-        simplification=50,
-        filter_by="FRANCE_ENTIERE",
-        source="EXPRESS-COG-CARTO-TERRITOIRE",
-        year=2022)
-    france["INSEE_DEP"] = france.INSEE_DEP.astype(str)
-    #france["INSEE_DEP"] = france["INSEE_DEP"].str.lstrip('0').fillna(value='0')
-    carte = france.merge(data, left_on="INSEE_DEP", right_on="DEP", how="inner")
-    return(carte)
-
 
+def donnee_carte(data, taille=None, dpi=None):
+# contours des départements (cartiflette), préparés une fois et gardés sur disque (voir geometrie.py)
+# niveau de détail choisi d'après la taille de la carte en pouces et sa résolution
+# (par défaut celles des figures matplotlib)
+    france = geometrie.departements_indexes(crs=4326, source="cartiflette",
+                                            tolerance=geometrie.tolerance_pour(taille, dpi))
+    # codes DEP de l'indicateur au format commun ("01", "2A", ...) quel que soit leur type d'origine
+    data = data.assign(DEP=schema.normalise_dep(data["DEP"]).astype(str))
+    # départements de l'indicateur ayant un contour, géométries reprises par position (sans merge)
+    carte = france.joindre(data)
+    return(carte)
 
-def mise_en_forme_carte(carte_prete, annees, mois, indicateur, titre_carte, titre_axe, plotting, evolution):
 
-    if evolution == False:
-        carte=carte_prete
-        indic=indicateur
-    elif evolution == True:
-        if all(item in [6,7,8,9] for item in mois):
-            saison = ["été"]         #  rouge
-        elif all(item in [1,2,3,12] for item in mois):
-            saison= ['hiver']
-        indic= "evol_2015"
-        carte=carte_prete
-        cols=custom_cmap_mixte         # bleu blanc rouge
 
-    if carte[indic].min() < 0:
+# palette et échelle d'une carte (cols, vmin, centre, vmax) : palette bleu blanc rouge centrée
+# sur 0 si l'indicateur prend des valeurs négatives, sinon rouge l'été et violet l'hiver
+def echelle_couleurs(valeurs, mois, evolution):
+    vmin, vmax = np.nanmin(valeurs), np.nanmax(valeurs)
+    cols = custom_cmap_mixte if evolution else None         # bleu blanc rouge
+    if vmin < 0:
         center = 0
         cols=custom_cmap_mixte
     else:
-        center = (carte[indic].max() - carte[indic].min())/2
+        # milieu de l'échelle (identique à (vmax - vmin)/2 quand vmin = 0)
+        center = vmin + (vmax - vmin)/2
         if all(item in [6,7,8,9] for item in mois):
             cols='OrRd'      #  rouge
         elif all(item in [1,2,3,12] for item in mois):
             cols='Purples'
 
-    norme = TwoSlopeNorm(vmin=carte[indic].min(),
-            vmax=carte[indic].max(),
-            vcenter=center) 
-    
+    return(cols, vmin, center, vmax)
+
+
+def couleurs_carte(valeurs, mois, evolution):
+    cols, vmin, center, vmax = echelle_couleurs(valeurs, mois, evolution)
+    norme = TwoSlopeNorm(vmin=vmin, vmax=vmax, vcenter=center)
+    return(cols, norme)
+
+
+# carte choroplèthe de `valeurs` (nom de colonne de carte, ou tableau dans l'ordre de ses lignes)
+def tracer_carte(carte, valeurs, cols, norme, plotting, titre_carte, titre_axe):
     carte.plot(
-         column=indic,
+         column=valeurs,
          cmap=cols,
          norm=norme,           # <-- centrage sur 0
          linewidth=0.8,
@@ -85,4 +79,230 @@ def mise_en_forme_carte(carte_prete, annees, mois, indicateur, titre_carte, titr
      )
     
     plotting.set_title(titre_carte, fontsize=15)
-    plotting.axis("off")
\ No newline at end of file
+    plotting.axis("off")
+
+
+def mise_en_forme_carte(carte_prete, annees, mois, indicateur, titre_carte, titre_axe, plotting, evolution):
+
+    # carte d'évolution : on représente le taux de variation avant / après 2015
+    indic = "evol_2015" if evolution else indicateur
+    cols, norme = couleurs_carte(carte_prete[indic], mois, evolution)
+    tracer_carte(carte_prete, indic, cols, norme, plotting, titre_carte, titre_axe)
+
+
+# ----------------------------------------------------------------------
+# plusieurs cartes d'un coup
+# ----------------------------------------------------------------------
+
+# mois de chaque saison
+MOIS_SAISON = {"été": [6, 7, 8, 9], "hiver": [1, 2, 3, 12]}
+
+
+# un panneau : dictionnaire {"data", "indicateur", "titre", "saison" (ou "mois"), "titre_axe",
+# "evolution"} ou tuple (data, indicateur, titre, saison[, titre_axe[, evolution]])
+# data : valeurs par département (colonne DEP) ; indicateur : colonne représentée
+def lire_panneau(panneau):
+    if not isinstance(panneau, dict):
+        panneau = dict(zip(["data", "indicateur", "titre", "saison", "titre_axe", "evolution"], panneau))
+    panneau = {"titre_axe": "", "evolution": False} | panneau
+    if "mois" not in panneau:
+        panneau["mois"] = MOIS_SAISON[panneau["saison"]]
+    return(panneau)
+
+
+# valeurs du panneau, une ligne par département (DEP au format commun)
+def valeurs_panneau(panneau):
+    data = panneau["data"].assign(DEP=schema.normalise_dep(panneau["data"]["DEP"]))
+    # plusieurs lignes par département (une par année pour nbj_par_an) : valeur moyenne
+    if data["DEP"].duplicated().any():
+        data = data.groupby("DEP", observed=True)[panneau["indicateur"]].mean().reset_index()
+    return(data)
+
+
+# taille de la figure et niveau de détail des contours : une case fait figsize / (nrows, ncols)
+# et la tolérance est choisie pour cette taille à `dpi` (geometrie.tolerance_pour)
+def disposition(n, ncols=2, figsize=None, dpi=None, tolerance=None):
+    nrows = -(-n // ncols)
+    figsize = figsize or (7.5 * ncols, 7.5 * nrows)
+    if tolerance is None:
+        tolerance = geometrie.tolerance_pour((figsize[0] / ncols, figsize[1] / nrows), dpi)
+    return(nrows, figsize, tolerance)
+
+
+def rendre_cartes(panneaux, ncols=2, figsize=None, crs=4326, source="cartiflette", dpi=None, tolerance=None):
+    """Dessine chaque panneau dans sa case d'une même figure (ncols cases par ligne).
+
+    Les contours (geometrie.Departements) sont lus une fois et partagés par tous les
+    panneaux ; les valeurs y sont rangées par position, sans fusion. Leur niveau de détail
+    suit la taille d'une case à la résolution `dpi`, sauf si `tolerance` est donnée.
+    Renvoie la figure."""
+    panneaux = [lire_panneau(p) for p in panneaux]
+    nrows, figsize, tolerance = disposition(len(panneaux), ncols, figsize, dpi, tolerance)
+    geo = geometrie.departements_indexes(crs=crs, source=source, tolerance=tolerance)
+    fig, ax = plt.subplots(nrows, ncols, figsize=figsize, squeeze=False)
+    for panneau, plotting in zip(panneaux, ax.flat):
+        valeurs = geo.lier(valeurs_panneau(panneau), panneau["indicateur"])
+        # seuls les départements ayant une valeur sont dessinés : les contours sans valeur (DROM
+        # à leurs vraies coordonnées) étendraient les limites de la carte et l'écraseraient
+        present = ~np.isnan(valeurs)
+        cols, norme = couleurs_carte(valeurs, panneau["mois"], panneau["evolution"])
+        tracer_carte(geo.gdf[present], valeurs[present], cols, norme, plotting, panneau["titre"], panneau["titre_axe"])
+    for plotting in ax.flat[len(panneaux):]:
+        plotting.axis("off")
+    return(fig)
+
+
+# ----------------------------------------------------------------------
+# images enregistrées (voir cache_cartes.py)
+# ----------------------------------------------------------------------
+
+# clé de la figure : valeurs liées, palette et échelle, titres de chaque panneau,
+# disposition et version des contours
+def cle_cartes(panneaux, ncols=2, figsize=None, crs=4326, source="cartiflette", dpi=None, tolerance=None):
+    nrows, figsize, tolerance = disposition(len(panneaux), ncols, figsize, dpi, tolerance)
+    parties = []
+    for panneau in map(lire_panneau, panneaux):
+        data = valeurs_panneau(panneau)
+        cols, vmin, center, vmax = echelle_couleurs(data[panneau["indicateur"]], panneau["mois"], panneau["evolution"])
+        parties.append((cache_cartes.empreinte_valeurs(data, panneau["indicateur"]),
+                        getattr(cols, "name", cols), vmin, center, vmax,
+                        panneau["titre"], panneau["titre_axe"]))
+    return(cache_cartes.cle("cartes", parties, ncols, figsize, crs, source,
+                            geometrie.version(crs, source, tolerance=tolerance)))
+
+
+def image_cartes(panneaux, format="png", dpi=100, dossier=None, **options):
+    """Chemin de l'image de rendre_cartes(panneaux, **options), dessinée seulement si
+    elle n'a pas déjà été enregistrée pour les mêmes valeurs (voir cache_cartes.py)."""
+    options = {"dpi": dpi} | options
+    return(cache_cartes.image(cle_cartes(panneaux, **options), lambda: rendre_cartes(panneaux, **options),
+                              format, dpi, dossier))
+
+
+# même carte que mise_en_forme_carte(donnee_carte(data), ...) dans sa propre figure (même
+# taille ; polygones dessinés dans l'ordre des départements et non des lignes de data),
+# rendue sous forme d'image enregistrée (à afficher avec cache_cartes.afficher)
+def image_carte(data, mois, indicateur, titre_carte, titre_axe, evolution=False, figsize=(6, 8),
+                format="png", dpi=100, dossier=None):
+    panneau = {"data": data, "indicateur": "evol_2015" if evolution else indicateur, "titre": titre_carte,
+               "mois": mois, "titre_axe": titre_axe, "evolution": evolution}
+    return(image_cartes([panneau], format, dpi, dossier, ncols=1, figsize=figsize))
+
+
+# les processus d'export ne dessinent que dans des fichiers : moteur Agg, sans fenêtre
+def _initialiser_processus():
+    mcolors.use("Agg")
+
+
+# panneaux et options de rendre_cartes d'une figure à exporter ; contours au niveau de
+# détail de la résolution d'export
+def _lire_figure(figure, dpi):
+    if isinstance(figure, tuple) and len(figure) == 2 and isinstance(figure[1], dict):
+        panneaux, options = figure
+    else:
+        panneaux, options = figure, {}
+    return(panneaux, {"dpi": dpi} | options)
+
+
+# construit les contours dont la figure aura besoin s'ils manquent (voir geometrie.construire)
+def _verifier_contours(panneaux, ncols=2, figsize=None, crs=4326, source="cartiflette", dpi=None, tolerance=None):
+    nrows, figsize, tolerance = disposition(len(panneaux), ncols, figsize, dpi, tolerance)
+    geometrie.verifier(crs, source, tolerance=tolerance)
+
+
+def _exporter_figure(nom, figure, dossier, formats, dpi, cache=True):
+    panneaux, options = _lire_figure(figure, dpi)
+    if cache:
+        images = cache_cartes.images(cle_cartes(panneaux, **options), lambda: rendre_cartes(panneaux, **options),
+                                     formats, dpi)
+        return([shutil.copyfile(images[f], Path(dossier) / f"{nom}.{f}") for f in formats])
+    fig = rendre_cartes(panneaux, **options)
+    chemins = []
+    for format_fichier in formats:
+        chemin = Path(dossier) / f"{nom}.{format_fichier}"
+        fig.savefig(chemin, dpi=dpi, bbox_inches="tight")
+        chemins.append(chemin)
+    plt.close(fig)
+    return(chemins)
+
+
+def exporter_cartes(figures, dossier="figures", formats=("png",), dpi=100, processus=None, cache=True):
+    """Écrit chaque figure dans dossier/<nom>.<format> (png, svg...).
+
+    figures : {nom: liste de panneaux} ou {nom: (liste de panneaux, options de rendre_cartes)}
+    Les figures sont réparties entre `processus` processus (par défaut un par cœur),
+    dessinées avec le moteur Agg, sans affichage. Avec cache=True, une figure déjà dessinée
+    pour les mêmes valeurs est reprise de Data/cartes (cache_cartes.py). Renvoie les chemins écrits."""
+    Path(dossier).mkdir(parents=True, exist_ok=True)
+    processus = min(processus or os.cpu_count() or 1, len(figures))
+    arguments = [(nom, figure, dossier, formats, dpi, cache) for nom, figure in figures.items()]
+    if processus <= 1:
+        return([c for args in arguments for c in _exporter_figure(*args)])
+    # contours construits ici, une fois, et non par chacun des processus
+    for figure in figures.values():
+        panneaux, options = _lire_figure(figure, dpi)
+        _verifier_contours(panneaux, **options)
+    with ProcessPoolExecutor(processus, initializer=_initialiser_processus) as executor:
+        futurs = [executor.submit(_exporter_figure, *args) for args in arguments]
+        return([c for f in futurs for c in f.result()])
+
+
+# cartes des indicateurs du rapport (mêmes panneaux que dans rapport.ipynb)
+def figures_rapport(cube, annees=range(2011, 2020)):
+    annees = list(annees)
+    ete, hiver = MOIS_SAISON["été"], MOIS_SAISON["hiver"]
+
+    def nbj(mois, var):
+        return(indicateurs_climat.nbj_par_an(cube, annees, mois, var))
+
+    def evol(saison, var):
+        return(indicateurs_climat.nbj_evol_2015(cube, saison, var))
+
+    def repartition(mois, exclure_idf):
+        return(indicateurs_tourisme.repartition_arrivees(cube, annees, mois, ["DEP"], exclure_idf=exclure_idf))
+
+    return({
+        "jours_extremes": [
+            (nbj(ete, "NBJTX30"), "NBJTX30", "Nombre de jours >30°", "été", "Nombre de jours"),
+            (nbj(ete, "NBJTX35"), "NBJTX35", "Nombre de jours >35°", "été", "Nombre de jours"),
+            (nbj(hiver, "NBJTX0"), "NBJTX0", "Nombre de jours <0°", "hiver", "Nombre de jours"),
+            (nbj(hiver, "NBJNEIG"), "NBJNEIG", "Nombre de jours de neige", "hiver", "Nombre de jours")],
+        "evolution_jours_extremes": [
+            (evol("été", "NBJTX30"), "evol_2015", "Evolution du nombre de jours >30°", "été", "Taux de variation", True),
+            (evol("été", "NBJTX35"), "evol_2015", "Evolution du nombre de jours >35°", "été", "Taux de variation", True),
+            (evol("hiver", "NBJTX0"), "evol_2015", "Evolution du nombre de jours <0°", "hiver", "Taux de variation", True),
+            (evol("hiver", "NBJNEIG"), "evol_2015", "Evolution du nombre de jours de neige", "hiver", "Taux de variation", True)],
+        "repartition_tourisme": [
+            (repartition(ete, False), "part_tourisme", "Répartition du tourisme d'été", "été", "proportion d'arrivées"),
+            (repartition(hiver, False), "part_tourisme", "Répartition du tourisme d'hiver", "hiver", "proportion d'arrivées")],
+        "repartition_tourisme_hors_idf": [
+            (repartition(ete, True), "part_tourisme", "Répartition du tourisme d'été (hors IDF)", "été", "proportion d'arrivées"),
+            (repartition(hiver, True), "part_tourisme", "Répartition du tourisme d'hiver (hors IDF)", "hiver", "proportion d'arrivées")],
+        "evolution_tourisme": [
+            (indicateurs_tourisme.evol_arrivees(cube, ete), "evol_2015",
+             "Evolution du tourisme d'été avant 2015 et après 2015", "été", "Taux de variation", True),
+            (indicateurs_tourisme.evol_arrivees(cube, hiver), "evol_2015",
+             "Evolution du tourisme d'hiver avant 2015 et après 2015", "hiver", "Taux de variation", True)],
+    })
+
+
+# toutes les cartes du rapport, sans le notebook, depuis la racine du projet :
+#   python -m src.package_project.cartes --dossier figures --formats png svg
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Export des cartes d'indicateurs du rapport")
+    parser.add_argument("--dossier", default="figures")
+    parser.add_argument("--formats", nargs="+", default=["png"])
+    parser.add_argument("--dpi", type=int, default=100)
+    parser.add_argument("--processus", type=int, default=None)
+    parser.add_argument("--sans-cache", action="store_true", help="redessine toutes les cartes")
+    args = parser.parse_args()
+
+    mcolors.use("Agg")
+    # base fusionnée, limitée aux années étudiées dans le rapport (avant 2020)
+    base = stockage.charger("base")
+    base = base.loc[base["AAAA"] < 2020]
+    chemins = exporter_cartes(figures_rapport(Cube(base)), args.dossier, args.formats, args.dpi,
+                              args.processus, cache=not args.sans_cache)
+    print(len(chemins), "fichier(s) écrit(s) dans", args.dossier)
\ No newline at end of file
@@ -0,0 +1,210 @@
+# cube (département x année x mois) des indicateurs de la base fusionnée
+# la base est une table avec une ligne par département, année et mois : on la range une fois
+# pour toutes dans des tableaux NumPy de forme (nb départements, nb années, 12), un par variable.
+# Les indicateurs (indicateurs_climat, indicateurs_tourisme) ne refont alors plus de filtre
+# ni de groupby sur toute la table : ils sélectionnent des tranches du cube et les réduisent.
+# - present : la ligne (département, année, mois) existe dans la base
+# - valeurs manquantes (NaN) ignorées dans les sommes et les moyennes, comme avec pandas
+# - masques de saison et de période calculés à la construction
+
+import hashlib
+from functools import cached_property
+
+import numpy as np
+import pandas as pd
+from src.import_data.fonctions import schema
+
+
+VARIABLES = schema.MESURES_CLIMAT + ["OBS_VALUE_CORR"]
+
+
+class Cube:
+    def __init__(self, data, variables=VARIABLES):
+        deps = schema.normalise_dep(data["DEP"])
+        codes = deps.cat.codes.to_numpy()
+        annees = data["AAAA"].to_numpy().astype(int)
+        mois = data["MM"].to_numpy().astype(int)
+
+        # départements présents, dans l'ordre du schéma commun
+        codes_presents = np.unique(codes)
+        self.deps = schema.DEP_DTYPE.categories[codes_presents]
+        self.annees = np.arange(annees.min(), annees.max() + 1)
+        self.mois = np.arange(1, 13)
+
+        i = np.searchsorted(codes_presents, codes)
+        j = annees - self.annees[0]
+        k = mois - 1
+        forme = (len(self.deps), len(self.annees), 12)
+
+        self.present = np.zeros(forme, dtype=bool)
+        self.present[i, j, k] = True
+        if self.present.sum() != len(data):
+            raise ValueError("le cube demande une seule ligne par département, année et mois")
+
+        # calculs en float64, résultats rendus dans le type de la base (float32 pour le climat)
+        self.valeurs = {}
+        self.types = {}
+        for var in variables:
+            if var in data.columns:
+                tableau = np.full(forme, np.nan)
+                tableau[i, j, k] = data[var].to_numpy(dtype="float64", na_value=np.nan)
+                self.valeurs[var] = tableau
+                self.types[var] = data[var].dtype
+        self.types["AAAA"] = data["AAAA"].dtype
+
+        # saison et période de chaque (année, mois), lues dans la base
+        self.masques_saison = self._masques(data, "saison", j, k)
+        self.masques_periode = self._masques(data, "periode", j, k)
+
+    def _masques(self, data, colonne, j, k):
+        if colonne not in data.columns:
+            return({})
+        masques = {}
+        for modalite in pd.unique(data[colonne].dropna()):
+            masque = np.zeros((len(self.annees), 12), dtype=bool)
+            lignes = (data[colonne] == modalite).to_numpy()
+            masque[j[lignes], k[lignes]] = True
+            masques[modalite] = masque
+        return(masques)
+
+    # empreinte du contenu du cube (clé des indicateurs mémorisés, voir memo.py) ;
+    # le cube n'est pas modifié après sa construction, on ne la calcule qu'une fois
+    @cached_property
+    def empreinte(self):
+        h = hashlib.sha256()
+        h.update(repr((list(self.deps), self.annees.tolist(), sorted(self.types.items(), key=str))).encode())
+        h.update(self.present.tobytes())
+        for var in sorted(self.valeurs):
+            h.update(var.encode())
+            h.update(self.valeurs[var].tobytes())
+        for masques in (self.masques_saison, self.masques_periode):
+            for modalite in sorted(masques):
+                h.update(modalite.encode())
+                h.update(masques[modalite].tobytes())
+        return(h.hexdigest())
+
+    # cube déjà construit, ou construit à partir de la base
+    @classmethod
+    def de(cls, data):
+        return(data if isinstance(data, cls) else cls(data))
+
+    # ------------------------------------------------------------------
+    # sélection
+    # ------------------------------------------------------------------
+
+    # masque (années x mois) des années et mois demandés (tous si None)
+    def masque(self, annees=None, mois=None, saison=None, periode=None):
+        masque = np.ones((len(self.annees), 12), dtype=bool)
+        if annees is not None:
+            masque &= np.isin(self.annees, list(annees))[:, None]
+        if mois is not None:
+            masque &= np.isin(self.mois, list(mois))[None, :]
+        if saison is not None:
+            masque &= self.masques_saison.get(saison, False)
+        if periode is not None:
+            masque &= self.masques_periode.get(periode, False)
+        return(masque)
+
+    # masque (départements) des départements à garder
+    def masque_deps(self, exclus=()):
+        return(~np.isin(self.deps, list(exclus)))
+
+    # ------------------------------------------------------------------
+    # réductions (valeurs manquantes ignorées)
+    # ------------------------------------------------------------------
+
+    # lignes sélectionnées : present restreint au masque (années x mois)
+    def selection(self, masque):
+        return(self.present & masque[None, :, :])
+
+    def somme(self, var, selection, axes):
+        valeurs = self.valeurs[var]
+        return(np.where(selection & ~np.isnan(valeurs), valeurs, 0.0).sum(axis=axes))
+
+    def moyenne(self, var, selection, axes):
+        valides = selection & ~np.isnan(self.valeurs[var])
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return(self.somme(var, selection, axes) / valides.sum(axis=axes))
+
+    # moyenne, sur les années ayant au moins un mois sélectionné, des sommes annuelles
+    def moyenne_des_sommes_annuelles(self, var, selection, axes=(1, 2)):
+        sommes = self.somme(var, selection, axes=2)
+        annees = selection.any(axis=2)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return(np.where(annees, sommes, 0.0).sum(axis=1) / annees.sum(axis=1))
+
+    def index_deps(self, garder=None):
+        deps = self.deps if garder is None else self.deps[garder]
+        return(pd.CategoricalIndex(deps, dtype=schema.DEP_DTYPE, name="DEP"))
+
+    # période de chaque année (NaN si l'année n'a pas de période)
+    def periode_par_annee(self):
+        periodes = np.full(len(self.annees), np.nan, dtype=object)
+        for modalite, masque in self.masques_periode.items():
+            periodes[masque.any(axis=1)] = modalite
+        return(pd.Categorical(periodes, dtype=schema.PERIODE_DTYPE))
+
+
+# valeur moyenne avant et après 2015 de chaque département (réduction `reduction` du cube
+# sur les mois du masque), et taux de variation entre les deux périodes
+def evolution_2015(cube, var, masque, reduction):
+    colonnes = {}
+    garder = np.zeros(len(cube.deps), dtype=bool)
+    for periode in ["avant_2015", "apres_2015"]:
+        if periode not in cube.masques_periode:
+            continue
+        selection = cube.selection(masque & cube.masque(periode=periode))
+        colonnes[periode] = reduction(var, selection, axes=(1, 2))
+        garder |= selection.any(axis=(1, 2))
+    data = pd.DataFrame({p: v[garder].astype(cube.types[var]) for p, v in colonnes.items()},
+                        index=cube.index_deps(garder))
+    data.columns.name = "periode"
+    data = data.reset_index(names=["DEP"])
+    data["evol_2015"] = np.where(data['avant_2015']!= 0, 
+                                 (data.apres_2015 - data.avant_2015)/data.avant_2015, 
+                                 np.nan)
+    return(data)
+
+
+# même taux de variation avant / après, pour toutes les années de rupture à la fois
+# (avant = années <= rupture, après = années > rupture, comme avant_2015 / apres_2015)
+# on calcule pour chaque département et chaque année un total et un effectif, puis leurs
+# sommes cumulées sur l'axe des années : la moyenne avant la rupture r est cumul[r] / effectif[r],
+# la moyenne après est (total - cumul[r]) / (effectif total - effectif[r])
+# mode "moyenne" : moyenne des valeurs mensuelles (comme nbj_evol_2015)
+# mode "somme_annuelle" : moyenne des sommes annuelles (comme evol_arrivees)
+# résultat : tableau (départements x ruptures) ; NaN si une des deux périodes est vide
+def evolution_ruptures(cube, var, masque, ruptures, mode="moyenne"):
+    selection = cube.selection(masque)
+    if mode == "moyenne":
+        valides = selection & ~np.isnan(cube.valeurs[var])
+        totaux = cube.somme(var, selection, axes=2)
+        effectifs = valides.sum(axis=2)
+    elif mode == "somme_annuelle":
+        effectifs = selection.any(axis=2)
+        totaux = np.where(effectifs, cube.somme(var, selection, axes=2), 0.0)
+    else:
+        raise ValueError(f"mode inconnu : {mode}")
+
+    cumul = np.cumsum(totaux, axis=1)
+    cumul_effectifs = np.cumsum(effectifs, axis=1)
+    j = np.searchsorted(cube.annees, ruptures)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        avant = cumul[:, j] / cumul_effectifs[:, j]
+        apres = (cumul[:, -1:] - cumul[:, j]) / (cumul_effectifs[:, -1:] - cumul_effectifs[:, j])
+        return(np.where(avant != 0, (apres - avant) / avant, np.nan))
+
+
+# tableau (départements x (saison, rupture)) des taux de variation avant / après chaque rupture
+def tableau_ruptures(cube, var, saisons, ruptures, mode):
+    ruptures = cube.annees[:-1] if ruptures is None else np.asarray(sorted(ruptures))
+    if len(ruptures) and (ruptures.min() < cube.annees[0] or ruptures.max() >= cube.annees[-1]):
+        raise ValueError(f"années de rupture entre {cube.annees[0]} et {cube.annees[-1] - 1} attendues")
+    blocs = []
+    garder = np.zeros(len(cube.deps), dtype=bool)
+    for saison in saisons:
+        masque = cube.masque(saison=saison)
+        blocs.append(evolution_ruptures(cube, var, masque, ruptures, mode))
+        garder |= cube.selection(masque).any(axis=(1, 2))
+    colonnes = pd.MultiIndex.from_product([list(saisons), ruptures], names=["saison", "rupture"])
+    return(pd.DataFrame(np.hstack(blocs)[garder], index=cube.index_deps(garder), columns=colonnes))
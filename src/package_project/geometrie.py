@@ -0,0 +1,271 @@
+# contours des départements, préparés une fois pour toutes
+# les cartes téléchargeaient et reprojetaient les contours à chaque appel (quatre fois pour une
+# figure 2 x 2). On les garde maintenant sur disque, déjà prêts :
+# - géométries réparées (make_valid) puis simplifiées en Lambert-93, sans ouvrir de trou
+#   entre départements voisins (les frontières communes sont simplifiées une seule fois)
+# - plusieurs niveaux de détail (TOLERANCES) : une carte de 500 pixels de large n'a pas besoin
+#   des sommets espacés de 100 m ; tolerance_pour choisit le niveau d'après la taille de la
+#   figure et sa résolution
+# - projetées en EPSG:4326 (cartes) et EPSG:3857 (Carte_dyn)
+# - enregistrées en GeoParquet dans Data/geometries/<source>_<crs>_<tolérance>.parquet
+# puis lues une seule fois par session python (lru_cache)
+#
+# sources : "cartiflette" (IGN, utilisée par cartes.donnee_carte) et "gregoiredavid"
+# (france-geojson, utilisée par Carte_dyn) ; colonnes DEP (code au format commun), nom, geometry
+#
+# Departements : les mêmes contours avec un index positionnel fixe des départements. Une valeur
+# par département (un indicateur) s'y range par simple indexation d'un tableau NumPy, au lieu
+# d'une fusion (merge) de GeoDataFrame qui recopie la colonne des géométries à chaque carte
+
+import hashlib
+import os
+from functools import lru_cache
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+from src.import_data.fonctions import schema, stockage
+
+
+URL_GREGOIREDAVID = "https://france-geojson.gregoiredavid.fr/repo/departements.geojson"
+
+CRS = [4326, 3857]
+# tolérances de simplification des niveaux de détail, en mètres (Lambert-93) ;
+# TOLERANCE : niveau le plus détaillé, utilisé quand on ne précise rien
+TOLERANCES = [100, 250, 500, 1000, 2000]
+TOLERANCE = TOLERANCES[0]
+
+# largeur de la France métropolitaine (environ 1 000 km) et part de la figure occupée par
+# la carte (le reste : légende, marges), pour passer de la taille de la figure à celle d'un pixel
+ETENDUE = 1_000_000
+PART_CARTE = 0.8
+# écart toléré entre contour simplifié et contour détaillé, en pixels : au-delà d'un demi-pixel,
+# l'anticrénelage rend la simplification visible sur les côtes et les frontières dentelées
+ECART_PIXELS = 0.5
+
+
+def dossier_geometries(dossier=None):
+    return(stockage.chemin("geometries", dossier))
+
+
+def chemin(source, crs, dossier=None, tolerance=TOLERANCE):
+    return(dossier_geometries(dossier) / f"{source}_{crs}_{tolerance}.parquet")
+
+
+# ----------------------------------------------------------------------
+# sources
+# ----------------------------------------------------------------------
+
+def lire_cartiflette():
+    # importé ici : cartiflette crée http_cache.sqlite dans le dossier courant dès son import
+    from cartiflette import carti_download
+
+    france = carti_download(
+        values = ["France"],
+        crs = 4326,
+        borders = "DEPARTEMENT",
+        vectorfile_format="geojson",
+        simplification=0,
+        filter_by="FRANCE_ENTIERE",
+        source="EXPRESS-COG-CARTO-TERRITOIRE",
+        year=2022)
+    return(france.rename(columns={"INSEE_DEP": "DEP", "LIBELLE_DEPARTEMENT": "nom"}))
+
+
+def lire_gregoiredavid():
+    return(gpd.read_file(URL_GREGOIREDAVID).rename(columns={"code": "DEP"}))
+
+
+SOURCES = {"cartiflette": lire_cartiflette, "gregoiredavid": lire_gregoiredavid}
+
+
+# ----------------------------------------------------------------------
+# préparation
+# ----------------------------------------------------------------------
+
+# contours réparés, un par département, triés dans l'ordre du schéma commun (en Lambert-93)
+def reparer(gdf):
+    gdf = gdf.copy()
+    gdf["DEP"] = schema.normalise_dep(gdf["DEP"].astype(str))
+    if "nom" not in gdf.columns:
+        gdf["nom"] = ""
+    gdf = gdf[["DEP", "nom", "geometry"]].sort_values("DEP").reset_index(drop=True)
+
+    lambert = gdf.to_crs(epsg=2154)
+    # sommets ramenés sur une grille d'un mètre : les frontières communes que les arrondis
+    # avaient légèrement décalées redeviennent identiques des deux côtés
+    lambert.geometry = shapely.set_precision(shapely.make_valid(lambert.geometry.to_numpy()), 1.0)
+    return(lambert)
+
+
+# contours réparés simplifiés à `tolerance` mètres
+def simplifier(lambert, tolerance):
+    geometries = lambert.geometry.to_numpy()
+    if tolerance:
+        # simplification « couverture » : les bords partagés restent communs aux deux voisins ;
+        # si les contours d'origine se chevauchent, on simplifie chaque département séparément
+        if shapely.coverage_is_valid(geometries):
+            geometries = shapely.coverage_simplify(geometries, tolerance)
+        else:
+            geometries = shapely.simplify(geometries, tolerance, preserve_topology=True)
+        geometries = shapely.make_valid(geometries)
+    simplifie = lambert.copy()
+    simplifie.geometry = geometries
+    return(simplifie)
+
+
+def preparer(gdf, tolerance=TOLERANCE):
+    return(simplifier(reparer(gdf), tolerance))
+
+
+# télécharge la source (une fois), répare ses contours, les simplifie à chaque niveau de
+# détail et les enregistre dans chacune des projections
+def construire(source="cartiflette", dossier=None, tolerances=TOLERANCES):
+    repare = reparer(SOURCES[source]())
+    dossier_geometries(dossier).mkdir(parents=True, exist_ok=True)
+    for tolerance in tolerances:
+        prepare = simplifier(repare, tolerance)
+        for crs in CRS:
+            # fichier temporaire puis renommage : un autre processus ne lit jamais un fichier à moitié écrit
+            fichier = chemin(source, crs, dossier, tolerance)
+            temporaire = fichier.with_name(f"{fichier.stem}.{os.getpid()}.tmp")
+            prepare.to_crs(epsg=crs).to_parquet(temporaire)
+            os.replace(temporaire, fichier)
+    vider_cache()
+
+
+def tolerance_pour(taille=None, dpi=None):
+    """Niveau de détail (tolérance en mètres) d'une carte de `taille` (largeur, hauteur en
+    pouces) dessinée à `dpi` : le plus simplifié dont les écarts restent sous ECART_PIXELS.
+
+    Par défaut, taille et résolution des figures de matplotlib (6,4 x 4,8 pouces à 100 dpi :
+    1000 m). Les cartes du rapport (6 x 8 pouces, ou cases de 7,5 pouces) sont à 1000 m ou
+    moins ; le niveau de 2000 m ne sert qu'aux vignettes (3 pouces ou moins à 100 dpi)."""
+    import matplotlib as mpl
+
+    taille = taille or mpl.rcParams["figure.figsize"]
+    dpi = dpi or mpl.rcParams["figure.dpi"]
+    pixel = ETENDUE / (min(taille) * dpi * PART_CARTE)
+    return(max([t for t in TOLERANCES if t <= ECART_PIXELS * pixel], default=TOLERANCE))
+
+
+# ----------------------------------------------------------------------
+# lecture
+# ----------------------------------------------------------------------
+
+# construit les contours manquants (une tolérance hors de TOLERANCES est ajoutée aux niveaux)
+def verifier(crs=4326, source="cartiflette", dossier=None, tolerance=TOLERANCE):
+    if not chemin(source, crs, dossier, tolerance).exists():
+        construire(source, dossier, sorted(set(TOLERANCES) | {tolerance}))
+
+
+@lru_cache(maxsize=None)
+def _lire(source, crs, dossier, tolerance):
+    verifier(crs, source, dossier, tolerance)
+    gdf = gpd.read_parquet(chemin(source, crs, dossier, tolerance))
+    gdf["DEP"] = gdf["DEP"].astype(str)
+    return(gdf)
+
+
+def departements(crs=4326, source="cartiflette", dossier=None, tolerance=TOLERANCE):
+    """Contours des départements (DEP, nom, geometry) dans la projection `crs`, simplifiés
+    à `tolerance` mètres (voir TOLERANCES et tolerance_pour).
+
+    Lus depuis Data/geometries (construits au premier appel), puis gardés en mémoire :
+    on rend une copie, que l'appelant peut modifier."""
+    if crs not in CRS:
+        raise ValueError(f"projection {crs} non préparée (disponibles : {CRS})")
+    return(_lire(source, crs, None if dossier is None else str(dossier), tolerance).copy())
+
+
+# empreinte du fichier des contours : change quand les contours sont reconstruits autrement
+# (autre source, autre tolérance), sert de version des contours dans les clés des images
+@lru_cache(maxsize=None)
+def _version(source, crs, dossier, tolerance):
+    verifier(crs, source, dossier, tolerance)
+    return(hashlib.sha256(chemin(source, crs, dossier, tolerance).read_bytes()).hexdigest()[:16])
+
+
+def version(crs=4326, source="cartiflette", dossier=None, tolerance=TOLERANCE):
+    return(_version(source, crs, None if dossier is None else str(dossier), tolerance))
+
+
+def vider_cache():
+    _lire.cache_clear()
+    _version.cache_clear()
+    departements_indexes.cache_clear()
+
+
+# ----------------------------------------------------------------------
+# index positionnel
+# ----------------------------------------------------------------------
+
+class Departements:
+    """Contours des départements dans un ordre fixe (celui du schéma commun).
+
+    lier(data, colonne) rend les valeurs de `colonne` rangées dans cet ordre (NaN pour les
+    départements absents de data), sans toucher aux géométries."""
+
+    def __init__(self, gdf):
+        self.gdf = gdf
+        self.deps = gdf["DEP"].to_numpy()
+        self.geometries = gdf.geometry.array
+        self.crs = gdf.crs
+        # rang de chaque code du schéma commun dans self.deps (-1 : pas de contour) ;
+        # une case de plus à la fin pour le code -1 des valeurs manquantes
+        self.rang = np.full(len(schema.DEP_DTYPE.categories) + 1, -1)
+        self.rang[pd.Categorical(self.deps, dtype=schema.DEP_DTYPE).codes] = np.arange(len(self.deps))
+        self.index = pd.Index(self.deps)
+        # position des codes écrits autrement que "01" (1, "1", 1.0...), trouvée une fois
+        self._autres_codes = {}
+
+    def __len__(self):
+        return(len(self.deps))
+
+    # position de chaque code de `deps` dans les contours (-1 si le département n'a pas de contour)
+    # colonne catégorielle du schéma : lecture directe des codes ; sinon recherche des codes
+    # au format commun, et normalisation des seuls codes écrits autrement
+    def positions(self, deps):
+        deps = pd.Series(deps)
+        if isinstance(deps.dtype, pd.CategoricalDtype) and deps.dtype == schema.DEP_DTYPE:
+            return(self.rang[deps.cat.codes.to_numpy()])
+        positions = self.index.get_indexer(deps)
+        absents = np.flatnonzero(positions < 0)
+        if len(absents):
+            autres = deps.to_numpy()[absents]
+            inconnus = {v for v in autres if not pd.isna(v) and v not in self._autres_codes}
+            if inconnus:
+                inconnus = list(inconnus)
+                codes = schema.normalise_dep(pd.Series(inconnus, dtype=object)).cat.codes.to_numpy()
+                self._autres_codes.update(zip(inconnus, self.rang[codes]))
+            positions[absents] = [self._autres_codes.get(v, -1) for v in autres]
+        return(positions)
+
+    # valeurs de `colonne` (une ligne par département) rangées dans l'ordre des contours
+    def lier(self, data, colonne, dep="DEP"):
+        positions = self.positions(data[dep])
+        garder = positions >= 0
+        if len(np.unique(positions[garder])) < garder.sum():
+            raise ValueError("une seule ligne par département attendue")
+        valeurs = data[colonne].to_numpy()
+        if pd.api.types.is_numeric_dtype(valeurs.dtype) and not pd.api.types.is_bool_dtype(valeurs.dtype):
+            resultat = np.full(len(self), np.nan)
+        else:
+            resultat = np.full(len(self), None, dtype=object)
+        resultat[positions[garder]] = valeurs[garder]
+        return(resultat)
+
+    # départements ayant une valeur, avec les colonnes de data (comme une jointure interne)
+    # seules les lignes retenues des géométries sont reprises
+    def joindre(self, data, dep="DEP"):
+        positions = self.positions(data[dep])
+        garder = positions >= 0
+        lignes = data.loc[garder].reset_index(drop=True)
+        return(gpd.GeoDataFrame(lignes, geometry=self.geometries[positions[garder]], crs=self.crs))
+
+
+# contours indexés partagés (un seul objet par source, projection et niveau de détail)
+@lru_cache(maxsize=None)
+def departements_indexes(crs=4326, source="cartiflette", tolerance=TOLERANCE):
+    return(Departements(departements(crs, source, tolerance=tolerance)))
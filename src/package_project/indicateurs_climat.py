@@ -1,27 +1,44 @@
 import pandas
 import numpy as np
+from src.package_project.cube import Cube, evolution_2015, tableau_ruptures
+from src.package_project.memo import memoise
+
+# les indicateurs sont calculés sur le cube (département x année x mois) de la base :
+# `data` est un Cube (à construire une fois avec Cube(df)) ou directement la base fusionnée
+# les résultats sont mémorisés (memo.py) : un même appel n'est calculé qu'une fois
 
 # moyenne temperature max quotidienne 
+@memoise()
 def temp_moy(data, annees, mois, var_temp):
-    data = data.loc[data['AAAA'].isin(annees)].loc[data['MM'].isin(mois)].groupby("DEP")[var_temp].mean()
-    return(data)
+    cube = Cube.de(data)
+    selection = cube.selection(cube.masque(annees, mois))
+    garder = selection.any(axis=(1, 2))
+    moyenne = cube.moyenne(var_temp, selection, axes=(1, 2))[garder]
+    return(pandas.Series(moyenne.astype(cube.types[var_temp]), index=cube.index_deps(garder), name=var_temp))
 
 #  nombre de jours d'une caractéristique climatique (au dessus/ en dessous d'une certaine température, neige, sécheresse...) sur toute la période
+@memoise()
 def nbj_par_an(data, annees, mois, var_climat):
-    data = pandas.DataFrame(data.loc[data['AAAA'].isin(annees)].loc[data['MM'].isin(mois)].groupby(["DEP","periode", "AAAA"])[var_climat].sum())
-    data = data.reset_index() 
+    cube = Cube.de(data)
+    selection = cube.selection(cube.masque(annees, mois))
+    # une ligne par département et année ayant au moins un mois sélectionné
+    i, j = np.nonzero(selection.any(axis=2))
+    somme = cube.somme(var_climat, selection, axes=2)[i, j]
+    data = pandas.DataFrame({"DEP": cube.index_deps()[i],
+                             "periode": cube.periode_par_annee()[j],
+                             "AAAA": cube.annees[j].astype(cube.types["AAAA"]),
+                             var_climat: somme.astype(cube.types[var_climat])})
     return(data)
 
 #  nombre moyen de jours au dessus/ en dessous d'une certaine température par année
+@memoise()
 def nbj_evol_2015(data, saison, var_climat):
-    data = pandas.DataFrame(data.loc[data['saison'].isin([saison])].groupby(["DEP","periode"])[var_climat].mean())
-    data = data.reset_index()
-    data = data.pivot(index="DEP", columns="periode", values=var_climat)
-    data = data.reset_index(names=["DEP"])
-    # data["evol_2015"] = if data.iloc["avant_2015"==0](data.apres_2015 - data.avant_2015)/data.avant_2015
-    data["evol_2015"] = np.where(data['avant_2015']!= 0, 
-                                 (data.apres_2015 - data.avant_2015)/data.avant_2015, 
-                                 np.nan)
-    return(data)
-
+    cube = Cube.de(data)
+    return(evolution_2015(cube, var_climat, cube.masque(saison=saison), cube.moyenne))
 
+# même indicateur pour toutes les années de rupture (et non la seule coupure de 2015) :
+# tableau départements x (saison, rupture) des taux de variation entre les années <= rupture
+# et les années > rupture (ruptures : toutes les années possibles si None)
+@memoise()
+def nbj_evol_ruptures(data, var_climat, saisons=("été", "hiver"), ruptures=None):
+    return(tableau_ruptures(Cube.de(data), var_climat, saisons, ruptures, mode="moyenne"))
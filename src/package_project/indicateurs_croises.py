@@ -1 +1,116 @@
-# lien entre évolution tourisme et évolution climat
\ No newline at end of file
+# lien entre évolution tourisme et évolution climat
+
+import numpy as np
+import pandas
+from src.package_project.memo import memoise
+
+
+# corrélations de Pearson de plusieurs couples de variables, par groupe (département, saison...)
+# plutôt qu'un groupby(...).apply(lambda g: g[x].corr(g[y])) par couple (une boucle python sur
+# les groupes à chaque fois), on calcule toutes les sommes par groupe d'un coup avec np.bincount :
+#   r = somme(dx * dy) / racine(somme(dx²) * somme(dy²)), dx et dy écarts à la moyenne du groupe
+# comme Series.corr, chaque couple ne garde que les lignes où ses deux variables sont renseignées
+#
+# paires : dictionnaire {nom de la colonne résultat: (x, y)} ou liste de couples (x, y)
+#          (colonne nommée corr_x_y)
+# par : variable(s) de regroupement (None = corrélation sur toute la base)
+# effectifs : ajoute pour chaque couple le nombre de lignes utilisées (colonne n_<nom>)
+# résultat : une ligne par groupe, prête pour cartes.donnee_carte quand par = "DEP"
+@memoise()
+def correlations(data, paires, par=None, effectifs=False):
+    if not isinstance(paires, dict):
+        paires = {f"corr_{x}_{y}": (x, y) for x, y in paires}
+    par = [] if par is None else ([par] if isinstance(par, str) else list(par))
+
+    if par:
+        groupes = data.groupby(par, observed=True, sort=True)
+        codes = groupes.ngroup().fillna(-1).to_numpy(dtype=np.int64)
+        resultat = groupes.size().index.to_frame(index=False)
+    else:
+        codes = np.zeros(len(data), dtype=np.int64)
+        resultat = pandas.DataFrame(index=[0])
+    nb_groupes = len(resultat)
+    # lignes dont une variable de regroupement est manquante : hors de tout groupe
+    dans_groupe = codes >= 0
+
+    for nom, (x, y) in paires.items():
+        vx = data[x].to_numpy(dtype="float64", na_value=np.nan)
+        vy = data[y].to_numpy(dtype="float64", na_value=np.nan)
+        garder = dans_groupe & ~np.isnan(vx) & ~np.isnan(vy)
+        c, vx, vy = codes[garder], vx[garder], vy[garder]
+
+        n = np.bincount(c, minlength=nb_groupes)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            dx = vx - (np.bincount(c, vx, nb_groupes) / n)[c]
+            dy = vy - (np.bincount(c, vy, nb_groupes) / n)[c]
+            r = np.bincount(c, dx * dy, nb_groupes) / np.sqrt(
+                np.bincount(c, dx * dx, nb_groupes) * np.bincount(c, dy * dy, nb_groupes))
+        r[n < 2] = np.nan
+        resultat[nom] = np.clip(r, -1, 1)
+        if effectifs:
+            resultat["n_" + nom] = n
+
+    return(resultat)
+
+
+# indices climatiques annuels de chaque saison : nom, mois retenus et poids des variables
+# - chaleur (été) : jours > 25° + jours > 30° + 2 x jours > 35°
+# - froid (hiver) : jours < 0° + 2 x jours de neige
+INDICES_SAISON = {
+    "été": ("indice_chaleur", [6, 7, 8, 9], {"NBJTX25": 1, "NBJTX30": 1, "NBJTX35": 2}),
+    "hiver": ("indice_froid", [12, 1, 2, 3], {"NBJTX0": 1, "NBJNEIG": 2}),
+}
+
+
+# arrivées et indice climatique de chaque saison, sommés par département et année (et par
+# variables de `par`, par exemple l'origine des touristes TOUR_RESID), avec les valeurs de
+# l'indice les années N-1, ..., N-retards
+# toutes les saisons, origines et années de retard sont calculées en une seule passe :
+# un groupby pour les sommes annuelles, puis les retards sont lus dans un tableau
+# (série x année) décalé sur l'axe des années. Le retard est calendaire : l'indice N-1 d'une
+# année qui suit une année absente est manquant (NaN), comme les premières années de chaque série
+# retards : nombre d'années de retard (1 = N-1) ou liste des retards voulus
+# résultat : {saison: DataFrame DEP, [par], AAAA, arrivees, indice_chaleur, indice_chaleur_N_1, ...}
+@memoise()
+def indices_decales(data, retards=1, saisons=("été", "hiver"), par=None):
+    retards = list(range(1, retards + 1)) if isinstance(retards, int) else sorted(retards)
+    par = [] if par is None else ([par] if isinstance(par, str) else list(par))
+
+    # numéro de la saison de chaque ligne, d'après son mois (-1 : mois hors saison)
+    saison_du_mois = np.full(13, -1)
+    for s, saison in enumerate(saisons):
+        saison_du_mois[INDICES_SAISON[saison][1]] = s
+    num_saison = saison_du_mois[data["MM"].to_numpy().astype(int)]
+
+    # indice mensuel de la saison de chaque ligne (variables manquantes comptées 0)
+    indice = np.zeros(len(data))
+    for s, saison in enumerate(saisons):
+        valeur = sum(p * np.nan_to_num(data[v].to_numpy(dtype="float64", na_value=np.nan))
+                     for v, p in INDICES_SAISON[saison][2].items())
+        indice = np.where(num_saison == s, valeur, indice)
+
+    garder = num_saison >= 0
+    cles = ["saison", "DEP"] + par + ["AAAA"]
+    mensuel = data.loc[garder, ["DEP"] + par + ["AAAA"]].assign(
+        saison=num_saison[garder],
+        arrivees=data.loc[garder, "OBS_VALUE_CORR"].to_numpy(),
+        indice=indice[garder])
+    annuel = mensuel.groupby(cles, observed=True, sort=True)[["arrivees", "indice"]].sum()
+
+    # tableau (série x année) de l'indice, une série par saison, département et groupe de `par`
+    codes_serie, series = pandas.factorize(annuel.index.droplevel("AAAA"))
+    annees = annuel.index.get_level_values("AAAA").to_numpy().astype(int)
+    j = annees - annees.min()
+    grille = np.full((len(series), j.max() + 1), np.nan)
+    grille[codes_serie, j] = annuel["indice"].to_numpy()
+    for k in retards:
+        decale = np.full_like(grille, np.nan)
+        decale[:, k:] = grille[:, :-k]
+        annuel[f"N_{k}"] = decale[codes_serie, j]
+
+    resultat = {}
+    for s, saison in enumerate(saisons):
+        nom = INDICES_SAISON[saison][0]
+        partie = annuel.xs(s, level="saison").reset_index()
+        resultat[saison] = partie.rename(columns={"indice": nom} | {f"N_{k}": f"{nom}_N_{k}" for k in retards})
+    return(resultat)
@@ -1,22 +1,55 @@
 import pandas
 import numpy as np
+from src.import_data.fonctions import schema
+from src.package_project.cube import Cube, evolution_2015, tableau_ruptures
+from src.package_project.memo import memoise
 
-# repartition arrivees touristiques
-def repartition_arrivees(data, annees, mois, par_groupe):
-    data = pandas.DataFrame(data.loc[data['AAAA'].isin(annees)].loc[data['MM'].isin(mois)].loc[~data["DEP"].isin([75,77,78,91,92,93,94,95])].groupby(par_groupe)["OBS_VALUE_CORR"].sum())
-    data = data.reset_index()
+# comme pour indicateurs_climat, `data` est le cube (département x année x mois) de la base
+# ou directement la base fusionnée
+# les résultats sont mémorisés (memo.py) : un même appel n'est calculé qu'une fois
+
+# repartition arrivees touristiques (hors Île-de-France si exclure_idf)
+# les codes DEP sont normalisés par le schéma commun : la comparaison avec les codes IDF
+# se fait donc bien entre codes "75", "77", ... et non entre entiers et chaînes
+# par_groupe : variables parmi DEP, AAAA et MM
+@memoise()
+def repartition_arrivees(data, annees, mois, par_groupe, exclure_idf=True):
+    cube = Cube.de(data)
+    selection = cube.selection(cube.masque(annees, mois))
+    if exclure_idf:
+        selection &= cube.masque_deps(exclus=schema.DEPS_IDF)[:, None, None]
+
+    # on somme sur les axes qui ne sont pas dans par_groupe
+    axes = {"DEP": 0, "AAAA": 1, "MM": 2}
+    inconnues = set(par_groupe) - set(axes)
+    if inconnues:
+        raise ValueError(f"repartition_arrivees : regroupement impossible sur {sorted(inconnues)}")
+    gardes = sorted(axes[g] for g in par_groupe)
+    reduits = tuple(a for a in range(3) if a not in gardes)
+    sommes = cube.somme("OBS_VALUE_CORR", selection, axes=reduits)
+    positions = np.nonzero(selection.any(axis=reduits))
+
+    modalites = {0: cube.index_deps(),
+                 1: cube.annees.astype(cube.types["AAAA"]),
+                 2: cube.mois.astype(schema.TYPES["MM"])}
+    noms = {a: g for g, a in axes.items()}
+    data = pandas.DataFrame({noms[a]: modalites[a][p] for a, p in zip(gardes, positions)})
+    data["OBS_VALUE_CORR"] = sommes[positions]
+    # mêmes ordres de colonnes et de lignes qu'un groupby sur par_groupe
+    data = data[list(par_groupe) + ["OBS_VALUE_CORR"]].sort_values(list(par_groupe), ignore_index=True)
     data["part_tourisme"] = ((data.OBS_VALUE_CORR / data.OBS_VALUE_CORR.sum()))*100
     return(data)
 
 
-# évolution avant et après 2015
+# évolution avant et après 2015 (moyenne des arrivées annuelles sur les mois choisis)
+@memoise()
 def evol_arrivees(data, mois):
-    data = pandas.DataFrame(data.loc[data['MM'].isin(mois)].groupby(["DEP", "periode", "AAAA"])["OBS_VALUE_CORR"].sum())
-    data = data.groupby(["DEP","periode"]).mean()
-    data = data.reset_index()
-    data = data.pivot(index="DEP", columns="periode", values="OBS_VALUE_CORR")
-    data = data.reset_index(names=["DEP"])
-    data["evol_2015"] = np.where(data['avant_2015']!= 0, 
-                                 (data.apres_2015 - data.avant_2015)/data.avant_2015, 
-                                 np.nan)
-    return(data)
\ No newline at end of file
+    cube = Cube.de(data)
+    return(evolution_2015(cube, "OBS_VALUE_CORR", cube.masque(mois=mois), cube.moyenne_des_sommes_annuelles))
+
+
+# évolution des arrivées (moyenne des arrivées annuelles de la saison) pour toutes les années
+# de rupture : tableau départements x (saison, rupture), voir nbj_evol_ruptures
+@memoise()
+def evol_arrivees_ruptures(data, saisons=("été", "hiver"), ruptures=None):
+    return(tableau_ruptures(Cube.de(data), "OBS_VALUE_CORR", saisons, ruptures, mode="somme_annuelle"))
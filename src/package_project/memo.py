@@ -0,0 +1,117 @@
+# mémorisation des indicateurs : le notebook appelle souvent le même indicateur avec les mêmes
+# arguments (une fois par panneau de carte, et à chaque nouvelle exécution d'une cellule)
+# - la clé est l'empreinte des données (contenu de la base ou du cube) et des arguments normalisés :
+#   annees et mois deviennent des ensembles ([6, 7, 8, 9] et range(6, 10) donnent la même clé)
+# - au-delà de taille_max résultats gardés, on oublie le moins récemment utilisé
+# - on rend une copie du résultat gardé : le modifier ne change pas le cache
+
+import functools
+import hashlib
+import inspect
+import threading
+from collections import OrderedDict
+from collections.abc import Iterator
+
+import numpy as np
+import pandas as pd
+
+
+# paramètres dont l'ordre et les répétitions ne comptent pas
+PARAMETRES_ENSEMBLES = ["annees", "mois"]
+
+
+def empreinte_df(df):
+    h = hashlib.sha256()
+    h.update(repr(list(zip(df.columns, df.dtypes.astype(str)))).encode())
+    h.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return(h.hexdigest())
+
+
+# empreinte des données : DataFrame, Series, ou tout objet ayant un attribut `empreinte` (Cube)
+def empreinte_donnees(data):
+    if hasattr(data, "empreinte"):
+        return(data.empreinte)
+    if isinstance(data, pd.Series):
+        data = data.to_frame()
+    return(empreinte_df(data))
+
+
+def normalise(nom, valeur):
+    if isinstance(valeur, (pd.DataFrame, pd.Series)) or hasattr(valeur, "empreinte"):
+        return(("donnees", empreinte_donnees(valeur)))
+    if isinstance(valeur, (str, bytes)) or np.isscalar(valeur) or valeur is None:
+        return(valeur.item() if isinstance(valeur, np.generic) else valeur)
+    if nom in PARAMETRES_ENSEMBLES:
+        return(frozenset(normalise(nom, v) for v in valeur))
+    # dictionnaire (par exemple paires) : l'ordre des éléments est gardé, il fixe l'ordre des
+    # colonnes du résultat
+    if isinstance(valeur, dict):
+        return(("dict",) + tuple((k, normalise(k, v)) for k, v in valeur.items()))
+    return(tuple(normalise(nom, v) for v in valeur))
+
+
+# copie du résultat, y compris des tableaux rangés dans un dictionnaire, un tuple ou une liste
+# (par exemple {saison: DataFrame} de indices_decales)
+def copie(resultat):
+    if isinstance(resultat, (pd.DataFrame, pd.Series, np.ndarray)):
+        return(resultat.copy())
+    if isinstance(resultat, dict):
+        return({k: copie(v) for k, v in resultat.items()})
+    if isinstance(resultat, (tuple, list)):
+        return(type(resultat)(copie(v) for v in resultat))
+    return(resultat)
+
+
+def memoise(taille_max=128):
+    """Garde les `taille_max` derniers résultats de la fonction décorée.
+
+    fonction.infos_cache() donne les succès, échecs et la taille du cache ;
+    fonction.vider_cache() le vide."""
+    def decorateur(fonction):
+        signature = inspect.signature(fonction)
+        resultats = OrderedDict()
+        compteurs = {"succes": 0, "echecs": 0}
+        verrou = threading.Lock()
+
+        @functools.wraps(fonction)
+        def fonction_memoisee(*args, **kwargs):
+            # un itérateur (reversed(...), générateur) serait épuisé par le calcul de la clé
+            args = [list(a) if isinstance(a, Iterator) else a for a in args]
+            kwargs = {k: list(v) if isinstance(v, Iterator) else v for k, v in kwargs.items()}
+            arguments = signature.bind(*args, **kwargs)
+            arguments.apply_defaults()
+            cle = tuple((nom, normalise(nom, v)) for nom, v in arguments.arguments.items())
+
+            with verrou:
+                if cle in resultats:
+                    resultats.move_to_end(cle)
+                    compteurs["succes"] += 1
+                    return(copie(resultats[cle]))
+                compteurs["echecs"] += 1
+
+            resultat = fonction(*args, **kwargs)
+            with verrou:
+                resultats[cle] = copie(resultat)
+                while len(resultats) > taille_max:
+                    resultats.popitem(last=False)
+            return(resultat)
+
+        def infos_cache():
+            with verrou:
+                return({**compteurs, "taille": len(resultats), "taille_max": taille_max})
+
+        def vider_cache():
+            with verrou:
+                resultats.clear()
+                compteurs.update(succes=0, echecs=0)
+
+        fonction_memoisee.infos_cache = infos_cache
+        fonction_memoisee.vider_cache = vider_cache
+        return(fonction_memoisee)
+    return(decorateur)
+
+
+# infos des caches de plusieurs fonctions mémorisées (par exemple tout un module d'indicateurs)
+def infos_caches(*modules):
+    return({f"{m.__name__.split('.')[-1]}.{nom}": f.infos_cache()
+            for m in modules for nom, f in vars(m).items() if hasattr(f, "infos_cache")})
@@ -0,0 +1,241 @@
+# incertitude des indicateurs par département : intervalles de confiance par bootstrap
+# et p-valeurs par permutation
+# avec seulement 9 années par département, une corrélation ou un taux d'évolution peut
+# beaucoup varier d'un échantillon à l'autre : on rééchantillonne pour en mesurer l'ampleur
+# - tous les départements sont rééchantillonnés en même temps : les valeurs de chaque
+#   département sont rangées dans une ligne d'un tableau (départements x observations), complété
+#   par des NaN, et chaque réplique est un tableau d'indices tirés dans cette ligne
+# - les répliques sont calculées par lots (tableaux (lot x départements x observations)) ;
+#   les lots peuvent être répartis sur plusieurs processus
+# - chaque lot a sa propre graine, tirée de `graine` : les résultats sont les mêmes avec ou
+#   sans processus
+#
+# correlations_ic : corrélation de Pearson de deux variables par groupe (comme
+#                   indicateurs_croises.correlations), IC bootstrap et test de nullité
+# evolution_ic : taux de variation avant / après une année de rupture (comme nbj_evol_2015
+#                et evol_arrivees), IC bootstrap et test d'absence de différence
+
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas
+from src.package_project.cube import Cube
+from src.package_project.memo import memoise
+
+
+TAILLE_LOT = 250
+
+
+# range les valeurs valides (masque) de chaque ligne au début de la ligne, NaN ensuite
+# (les colonnes au-delà de la plus longue ligne sont retirées)
+def tasser(valeurs, masque):
+    longueurs = masque.sum(axis=1)
+    ordre = np.argsort(~masque, axis=1, kind="stable")[:, :max(longueurs.max(initial=0), 1)]
+    tasse = np.take_along_axis(np.where(masque, valeurs, np.nan), ordre, axis=1)
+    return(tasse, longueurs)
+
+
+# tableau (groupes x observations) à partir d'une colonne et du numéro de groupe de chaque ligne
+def par_groupe(valeurs, codes, nb_groupes):
+    longueurs = np.bincount(codes, minlength=nb_groupes)
+    ordre = np.argsort(codes, kind="stable")
+    debuts = np.concatenate([[0], np.cumsum(longueurs)[:-1]])
+    position = np.arange(len(codes)) - debuts[codes[ordre]]
+    tableau = np.full((nb_groupes, max(longueurs.max(initial=0), 1)), np.nan)
+    tableau[codes[ordre], position] = valeurs[ordre]
+    return(tableau)
+
+
+# ----------------------------------------------------------------------
+# tirages
+# ----------------------------------------------------------------------
+
+# indices bootstrap (lot x groupes x observations) : n tirages avec remise parmi les n
+# observations de chaque groupe, positions au-delà de n marquées invalides
+def tirage_bootstrap(rng, taille, longueurs, largeur):
+    u = rng.random((taille, len(longueurs), largeur))
+    indices = (u * longueurs[None, :, None]).astype(np.int64)
+    valides = np.arange(largeur)[None, None, :] < longueurs[None, :, None]
+    return(np.where(valides, indices, 0), valides)
+
+
+# permutations (lot x groupes x observations) des n premières positions de chaque groupe
+def tirage_permutation(rng, taille, longueurs, largeur):
+    cles = rng.random((taille, len(longueurs), largeur))
+    cles[:, np.arange(largeur)[None, :] >= longueurs[:, None]] = 2.0
+    return(np.argsort(cles, axis=2))
+
+
+# valeurs de chaque groupe aux indices tirés (indices dans la ligne du groupe)
+def prendre(tableau, indices):
+    decalages = (np.arange(tableau.shape[0]) * tableau.shape[1])[None, :, None]
+    return(np.take(tableau.ravel(), indices + decalages))
+
+
+# ----------------------------------------------------------------------
+# statistiques (calculées sur le dernier axe, NaN ignorés)
+# ----------------------------------------------------------------------
+
+# (formule en une passe : les valeurs sont centrées par groupe avant le rééchantillonnage,
+# les sommes de carrés restent donc petites devant les écarts qu'elles mesurent)
+def correlation(x, y):
+    valides = ~(np.isnan(x) | np.isnan(y))
+    n = valides.sum(axis=-1)
+    x = np.where(valides, x, 0.0)
+    y = np.where(valides, y, 0.0)
+    sx, sy = x.sum(axis=-1), y.sum(axis=-1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cov = np.einsum("...i,...i->...", x, y) - sx * sy / n
+        var_x = np.einsum("...i,...i->...", x, x) - sx * sx / n
+        var_y = np.einsum("...i,...i->...", y, y) - sy * sy / n
+        r = cov / np.sqrt(var_x * var_y)
+    return(np.where(n >= 2, np.clip(r, -1, 1), np.nan))
+
+
+def evolution(avant, apres):
+    with np.errstate(invalid="ignore", divide="ignore"):
+        moy_avant = np.nanmean(avant, axis=-1)
+        moy_apres = np.nanmean(apres, axis=-1)
+        return(np.where(moy_avant != 0, (moy_apres - moy_avant) / moy_avant, np.nan))
+
+
+# ----------------------------------------------------------------------
+# lots de répliques
+# ----------------------------------------------------------------------
+
+# un lot de `taille` répliques de la statistique `nom` ; fonction du module (et non fonction
+# locale) pour pouvoir être envoyée à un autre processus
+def lot(nom, donnees, graine, taille):
+    rng = np.random.default_rng(graine)
+    if nom == "correlation_bootstrap":
+        x, y, longueurs = donnees
+        indices, valides = tirage_bootstrap(rng, taille, longueurs, x.shape[1])
+        return(correlation(np.where(valides, prendre(x, indices), np.nan), prendre(y, indices)))
+    if nom == "correlation_permutation":
+        x, y, longueurs = donnees
+        return(correlation(x[None], prendre(y, tirage_permutation(rng, taille, longueurs, x.shape[1]))))
+    if nom == "evolution_bootstrap":
+        avant, n_avant, apres, n_apres = donnees
+        i_avant, v_avant = tirage_bootstrap(rng, taille, n_avant, avant.shape[1])
+        i_apres, v_apres = tirage_bootstrap(rng, taille, n_apres, apres.shape[1])
+        return(evolution(np.where(v_avant, prendre(avant, i_avant), np.nan),
+                         np.where(v_apres, prendre(apres, i_apres), np.nan)))
+    if nom == "evolution_permutation":
+        # les observations des deux périodes sont mélangées puis redistribuées :
+        # les n_avant premières forment la période avant
+        groupees, n_avant, longueurs = donnees
+        permutees = prendre(groupees, tirage_permutation(rng, taille, longueurs, groupees.shape[1]))
+        position = np.arange(groupees.shape[1])[None, None, :]
+        return(evolution(np.where(position < n_avant[None, :, None], permutees, np.nan),
+                         np.where(position >= n_avant[None, :, None], permutees, np.nan)))
+    raise ValueError(f"statistique inconnue : {nom}")
+
+
+# n_repliques répliques, par lots de TAILLE_LOT, éventuellement sur `processus` processus
+def repliques(nom, donnees, n_repliques, graine, processus=None):
+    tailles = [TAILLE_LOT] * (n_repliques // TAILLE_LOT)
+    if n_repliques % TAILLE_LOT:
+        tailles.append(n_repliques % TAILLE_LOT)
+    if not isinstance(graine, np.random.SeedSequence):
+        graine = np.random.SeedSequence(graine)
+    graines = graine.spawn(len(tailles))
+    if processus is None or processus <= 1:
+        lots = [lot(nom, donnees, g, t) for g, t in zip(graines, tailles)]
+    else:
+        with ProcessPoolExecutor(max_workers=processus) as executor:
+            lots = list(executor.map(lot, [nom] * len(tailles), [donnees] * len(tailles), graines, tailles))
+    return(np.concatenate(lots, axis=0))
+
+
+# bornes de l'intervalle de confiance (percentiles des répliques bootstrap) et p-valeur
+# bilatérale (part des permutations au moins aussi éloignées de 0 que la valeur observée)
+def resume(observe, bootstrap, permutation, niveau):
+    alpha = (1 - niveau) / 2
+    # départements sans aucune réplique calculable (moins de deux observations) : bornes NaN
+    with np.errstate(invalid="ignore"), warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        bornes = np.nanquantile(bootstrap, [alpha, 1 - alpha], axis=0)
+        extremes = (np.abs(permutation) >= np.abs(observe)[None, :] - 1e-12).sum(axis=0)
+        p_valeur = (1 + extremes) / (1 + (~np.isnan(permutation)).sum(axis=0))
+    return(bornes[0], bornes[1], np.where(np.isnan(observe), np.nan, p_valeur))
+
+
+# ----------------------------------------------------------------------
+# indicateurs
+# ----------------------------------------------------------------------
+
+# corrélation de x et y par groupe (lignes où les deux sont renseignées), avec son IC bootstrap
+# au niveau `niveau` et la p-valeur du test de corrélation nulle (permutation de y dans chaque groupe)
+@memoise()
+def correlations_ic(data, x, y, par="DEP", n_repliques=2000, niveau=0.95, graine=0, processus=None):
+    data = data.loc[data[x].notna() & data[y].notna()]
+    groupes = data.groupby(par, observed=True, sort=True)
+    codes = groupes.ngroup().fillna(-1).to_numpy(dtype=np.int64)
+    dans_groupe = codes >= 0
+    resultat = groupes.size().index.to_frame(index=False)
+    nb = len(resultat)
+
+    vx = par_groupe(data[x].to_numpy(dtype="float64")[dans_groupe], codes[dans_groupe], nb)
+    vy = par_groupe(data[y].to_numpy(dtype="float64")[dans_groupe], codes[dans_groupe], nb)
+    # centrage par groupe (la corrélation n'en dépend pas, voir correlation)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        vx, vy = vx - np.nanmean(vx, axis=1)[:, None], vy - np.nanmean(vy, axis=1)[:, None]
+    longueurs = np.bincount(codes[dans_groupe], minlength=nb)
+    donnees = (vx, vy, longueurs)
+
+    graines = np.random.SeedSequence(graine).spawn(2)
+    observe = correlation(vx, vy)
+    bootstrap = repliques("correlation_bootstrap", donnees, n_repliques, graines[0], processus)
+    permutation = repliques("correlation_permutation", donnees, n_repliques, graines[1], processus)
+
+    resultat["corr"] = observe
+    resultat["borne_inf"], resultat["borne_sup"], resultat["p_valeur"] = resume(observe, bootstrap, permutation, niveau)
+    resultat["n"] = longueurs
+    return(resultat)
+
+
+# taux de variation de var entre les années <= rupture et les années > rupture, sur les mois
+# (ou la saison) choisis, avec son IC bootstrap (tirages dans chaque période) et la p-valeur
+# du test d'absence de différence (permutation des observations entre les deux périodes)
+# mode "moyenne" : observations = valeurs mensuelles (comme nbj_evol_2015)
+# mode "somme_annuelle" : observations = sommes annuelles (comme evol_arrivees)
+@memoise()
+def evolution_ic(data, var, mois=None, saison=None, mode="moyenne", rupture=2015,
+                 n_repliques=2000, niveau=0.95, graine=0, processus=None):
+    cube = Cube.de(data)
+    selection = cube.selection(cube.masque(mois=mois, saison=saison))
+    avant_rupture = (cube.annees <= rupture)[None, :]
+    if mode == "moyenne":
+        valides = selection & ~np.isnan(cube.valeurs[var])
+        valeurs = cube.valeurs[var]
+        periodes = np.broadcast_to(avant_rupture[:, :, None], valides.shape)
+        forme = (len(cube.deps), -1)
+        valeurs, valides, periodes = valeurs.reshape(forme), valides.reshape(forme), periodes.reshape(forme)
+    elif mode == "somme_annuelle":
+        valides = selection.any(axis=2)
+        valeurs = cube.somme(var, selection, axes=2)
+        periodes = np.broadcast_to(avant_rupture, valides.shape)
+    else:
+        raise ValueError(f"mode inconnu : {mode}")
+
+    avant, n_avant = tasser(valeurs, valides & periodes)
+    apres, n_apres = tasser(valeurs, valides & ~periodes)
+    # observations des deux périodes à la suite (avant puis après) pour les permutations
+    groupees = np.hstack([avant, apres])
+    groupees, longueurs = tasser(groupees, ~np.isnan(groupees))
+
+    # mêmes départements que nbj_evol_2015 / evol_arrivees : ceux qui ont des lignes sélectionnées
+    garder = selection.any(axis=(1, 2))
+    graines = np.random.SeedSequence(graine).spawn(2)
+    observe = evolution(avant, apres)
+    bootstrap = repliques("evolution_bootstrap", (avant, n_avant, apres, n_apres), n_repliques, graines[0], processus)
+    permutation = repliques("evolution_permutation", (groupees, n_avant, longueurs), n_repliques, graines[1], processus)
+    borne_inf, borne_sup, p_valeur = resume(observe, bootstrap, permutation, niveau)
+
+    return(pandas.DataFrame({"DEP": cube.index_deps(garder),
+                             f"evol_{rupture}": observe[garder],
+                             "borne_inf": borne_inf[garder],
+                             "borne_sup": borne_sup[garder],
+                             "p_valeur": p_valeur[garder]}))